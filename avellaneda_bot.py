@@ -1,21 +1,26 @@
 import asyncio
+import json
 import time
-import math
 import logging
 import os
 # 假設 GridTradingBot 和所有必要的常量、logger 都從 bot.py 導入
-from bot import GridTradingBot, logger 
+from bot import GridTradingBot, logger, audit_logger
 from avellaneda_utils import auto_calculate_params
+from avellaneda_pricing import AvellanedaPricer
 from dotenv import load_dotenv
 load_dotenv()
 
 # ==================== Avellaneda 參數配置 (動態獲取) ====================
 # 【重要】這些參數將在 main 函數中被 auto_calculate_params 的結果覆蓋
 AVE_GAMMA = 1.0       # 風險厭惡係數 (固定值)
-AVE_T_END = 1         # 交易時間週期 (T, 調整為 1 小時, 固定值)
+AVE_T_END = 1         # 交易時間週期 (T, 1 小時；見 AVE_ROLLING_HORIZON)
 Taker_Fee_Rate = 0.0005 # <-- 【請在此處設置您的 Taker 費率】
 AVE_SIGMA = 0.0       # <--- 初始為 0，將被計算值覆蓋
 AVE_ETA = 0.0         # <--- 初始為 0，將被計算值覆蓋
+AVE_ROLLING_HORIZON = True  # T 在每個 AVE_T_END 週期內衰減至 0 後重置；False 時 T 恆為 AVE_T_END
+# 按實時小時波動率切換的參數組，None 表示沿用基準值；空列表表示不切換
+# 例: [{"max_sigma": 0.003, "gamma": 0.5, "eta": None}, {"max_sigma": 1.0, "gamma": 2.0, "eta": None}]
+AVE_REGIMES = []
 
 # 假設 bot.py 中的核心配置
 API_KEY = os.getenv("API_KEY")
@@ -27,15 +32,20 @@ INITIAL_QUANTITY = 1
 LEVERAGE = 20
 POSITION_THRESHOLD = 500
 ORDER_COOLDOWN_TIME = 60 
+PAPER_TRADING = os.getenv("PAPER_TRADING", "0") == "1"  # 紙上交易: 使用實時行情，本地模擬成交
 
 # ==================== Avellaneda 繼承類 (保持不變) ====================
 class AvellanedaGridBot(GridTradingBot):
+    RELOADABLE_PARAMS = {
+        **GridTradingBot.RELOADABLE_PARAMS,
+        "AVE_GAMMA": ("gamma", float, lambda v: v > 0),
+    }
     
     def __init__(self, api_key, api_secret, coin_name, grid_spacing, initial_quantity, leverage, 
-                 take_profit_spacing=None, gamma=AVE_GAMMA, eta=AVE_ETA, sigma=AVE_SIGMA, T_end=AVE_T_END):
+                 take_profit_spacing=None, gamma=AVE_GAMMA, eta=AVE_ETA, sigma=AVE_SIGMA, T_end=AVE_T_END, **kwargs):
         
         # 1. 呼叫父類別的初始化方法
-        super().__init__(api_key, api_secret, coin_name, grid_spacing, initial_quantity, leverage, take_profit_spacing)
+        super().__init__(api_key, api_secret, coin_name, grid_spacing, initial_quantity, leverage, take_profit_spacing, **kwargs)
         
         # 2. 初始化 Avellaneda 專有參數
         # 這裡使用的是 main 函數計算後的最新全局變量值
@@ -43,46 +53,94 @@ class AvellanedaGridBot(GridTradingBot):
         self.eta = eta              # 交易成本係數
         self.sigma = sigma          # 波動率估計
         self.T_end = T_end          # 交易總時間 (單位：小時)
+        self.position_threshold = POSITION_THRESHOLD
+        self.order_cooldown_time = ORDER_COOLDOWN_TIME
         self.reserve_price = 0      
         self.inventory = 0          
         self.best_bid = 0           
         self.best_ask = 0           
+        self.delta = 0
+        self.pricer = AvellanedaPricer(T_end, rolling=AVE_ROLLING_HORIZON, regimes=AVE_REGIMES)
+        self.last_regime = None
+        self.refresh_task = None  # 熱啟動後台重算 sigma/eta 的任務
         logger.info(f"Avellaneda Bot 初始化: Gamma={gamma}, Eta={eta:.2f}, Sigma={sigma:.8f}")
     
     def _calculate_avellaneda_prices(self, price):
         """
         [輔助方法] 計算 Avellaneda 模型下的公允價格和最佳報價
+        每次調價只在 adjust_grid_strategy 中調用一次，多空兩側共用結果
         """
         
-        # 1. 更新庫存 (淨持倉量)
+        # 1. 按實時波動率確定生效的 gamma/eta
+        gamma, eta = self.pricer.effective_params(self.gamma, self.eta)
+        if self.pricer.regime is not self.last_regime:
+            logger.info(f"Avellaneda 參數組切換: {self.pricer.regime} (實時波動率 {self.pricer.estimator.sigma:.8f}), "
+                        f"生效 Gamma={gamma}, Eta={eta:.2f}, 基準 Gamma={self.gamma}")
+            self.last_regime = self.pricer.regime
+
+        # 2. 更新庫存 (淨持倉量)
         self.inventory = self.long_position - self.short_position
-        
-        # 2. 剩餘時間 T
-        T = self.T_end
-        
-        # 3. 公允價格 (Reserve Price) 計算: R = S - q * gamma * sigma^2 * T
-        # S = 當前市場價格 (price)
-        self.reserve_price = price - self.inventory * self.gamma * (self.sigma**2) * T
 
-        # 4. 最優報價寬度 (delta) 計算: Delta = 1/2 * gamma * sigma^2 * T + 1/gamma * ln(1 + gamma / eta)
-        try:
-            term1 = 0.5 * self.gamma * (self.sigma**2) * T
-            term2 = (1 / self.gamma) * math.log(1 + self.gamma / self.eta)
-            delta_pct = term1 + term2 # 這是百分比 Delta
-            delta = delta_pct * price # 轉換為絕對價格 Delta
-        except (ValueError, ZeroDivisionError) as e:
-            logger.error(f"Delta 計算異常: {e}. 使用備用 Delta.")
+        # 3. 由報價引擎計算公允價格與雙邊報價 (T 隨週期衰減)
+        self.reserve_price, best_bid, best_ask, delta = self.pricer.quote(price, self.inventory, gamma, eta, self.sigma)
+        if delta is None:
+            logger.error(f"Delta 計算異常: gamma={gamma}, eta={eta}. 使用備用 Delta.")
             delta = self.grid_spacing * price * 0.5 # 使用基於價格的網格備用 Delta
-            
-        # 5. 計算最佳報價
-        self.best_bid = self.reserve_price - delta
-        self.best_ask = self.reserve_price + delta
-        
-        # 價格保護
-        self.best_bid = max(0.0, self.best_bid) 
-        self.best_ask = max(0.0, self.best_ask) 
-        
-        logger.info(f"Avellaneda: R={self.reserve_price:.8f}, Inv={self.inventory:.2f}, Delta={delta:.8f}")
+            best_bid = max(0.0, self.reserve_price - delta)
+            best_ask = max(0.0, self.reserve_price + delta)
+        self.best_bid, self.best_ask, self.delta = best_bid, best_ask, delta
+        logger.info(f"Avellaneda: R={self.reserve_price:.8f}, Inv={self.inventory:.2f}, Delta={delta:.8f}, "
+                    f"T={self.pricer.T:.4f}")
+
+    def apply_pending_params(self):
+        """[覆寫] 熱更新的 gamma 被當前參數組覆蓋時提示，並記入審計日誌"""
+        gamma = self.gamma
+        super().apply_pending_params()
+        regime = self.pricer.regime
+        if self.gamma != gamma and regime and regime.get("gamma"):
+            logger.warning(f"AVE_GAMMA 已更新為 {self.gamma}，但當前參數組覆蓋為 {regime['gamma']}，"
+                           f"切換到不覆蓋 gamma 的參數組前報價不受影響")
+            audit_logger.info(json.dumps({
+                "symbol": self.ccxt_symbol, "status": "overridden_by_regime",
+                "param": "AVE_GAMMA", "value": self.gamma, "effective": regime["gamma"],
+            }, ensure_ascii=False))
+
+    def snapshot_state(self):
+        """[覆寫] 快照中加入 sigma/eta 估算狀態"""
+        state = super().snapshot_state()
+        estimator = self.pricer.estimator
+        state["estimator"] = {
+            "gamma": self.gamma, "eta": self.eta, "sigma": self.sigma, "T_end": self.T_end,
+            "live_var_rate": estimator.var_rate, "live_samples": estimator.samples,
+        }
+        return state
+
+    def restore_snapshot(self, state):
+        """[覆寫] 恢復 sigma/eta 估算狀態"""
+        super().restore_snapshot(state)
+        estimator = state.get("estimator")
+        if estimator:
+            self.sigma = estimator["sigma"]
+            self.eta = estimator["eta"]
+            self.pricer.estimator.var_rate = estimator.get("live_var_rate", 0.0)
+            self.pricer.estimator.samples = estimator.get("live_samples", 0)
+
+    async def handle_ticker_update(self, message):
+        """[覆寫] 每個 ticker 更新實時波動率估計"""
+        await super().handle_ticker_update(message)
+        if self.latest_price:
+            self.pricer.estimator.update(self.latest_price)
+
+    async def refresh_params(self, taker_fee):
+        """後台重新計算 sigma/eta，避免熱啟動時阻塞首次報價"""
+        loop = asyncio.get_running_loop()
+        try:
+            sigma, eta = await loop.run_in_executor(None, auto_calculate_params, self.coin_name, taker_fee)
+        except Exception as e:
+            logger.error(f"後台更新 Avellaneda 參數失敗，沿用快照值: {e}")
+            return
+        logger.info(f"Avellaneda 參數已更新: Sigma {self.sigma:.8f} -> {sigma:.8f}, Eta {self.eta:.2f} -> {eta:.2f}")
+        self.sigma, self.eta = sigma, eta
         
     
     def update_mid_price(self, side, price):
@@ -93,13 +151,12 @@ class AvellanedaGridBot(GridTradingBot):
 
 
     async def place_long_orders(self, latest_price):
-        """[覆寫] 根據 Avellaneda 的價格掛出多頭開倉和止盈單。"""
+        """[覆寫] 根據 Avellaneda 的價格掛出多頭開倉和止盈單（報價已由 adjust_grid_strategy 算好）。"""
         try:
-            self.update_mid_price('long', latest_price) 
             self.get_take_profit_quantity(self.long_position, 'long')
 
             if self.long_position > 0:
-                if self.long_position > POSITION_THRESHOLD:
+                if self.long_position > self.position_threshold:
                     if self.sell_long_orders <= 0:
                         self.place_take_profit_order(self.ccxt_symbol, 'long', self.best_ask, self.long_initial_quantity)
                 else:
@@ -113,13 +170,12 @@ class AvellanedaGridBot(GridTradingBot):
             logger.error(f"掛 Avellaneda 多頭訂單失敗: {e}")
 
     async def place_short_orders(self, latest_price):
-        """[覆寫] 根據 Avellaneda 的價格掛出空頭開倉和止盈單。"""
+        """[覆寫] 根據 Avellaneda 的價格掛出空頭開倉和止盈單（報價已由 adjust_grid_strategy 算好）。"""
         try:
-            self.update_mid_price('short', latest_price) 
             self.get_take_profit_quantity(self.short_position, 'short')
 
             if self.short_position > 0:
-                if self.short_position > POSITION_THRESHOLD:
+                if self.short_position > self.position_threshold:
                     if self.buy_short_orders <= 0:
                         self.place_take_profit_order(self.ccxt_symbol, 'short', self.best_bid, self.short_initial_quantity)
                 else:
@@ -139,35 +195,45 @@ class AvellanedaGridBot(GridTradingBot):
         latest_price = self.latest_price
         
         if latest_price:
+            # 每次調價只計算一次報價，多空兩側共用
             self.update_mid_price(None, latest_price) 
 
         if self.long_position == 0:
             await self.initialize_long_orders()
         else:
-            if not (self.long_position > POSITION_THRESHOLD and current_time - self.last_long_order_time < ORDER_COOLDOWN_TIME):
+            if not (self.long_position > self.position_threshold and current_time - self.last_long_order_time < self.order_cooldown_time):
                 await self.place_long_orders(latest_price)
 
         if self.short_position == 0:
             await self.initialize_short_orders()
         else:
-            if not (self.short_position > POSITION_THRESHOLD and current_time - self.last_short_order_time < ORDER_COOLDOWN_TIME):
+            if not (self.short_position > self.position_threshold and current_time - self.last_short_order_time < self.order_cooldown_time):
                 await self.place_short_orders(latest_price)
 
 
 # 7. 主程序入口
 async def main():
-    # 步驟 1: 自動計算 Avellaneda 參數，並覆蓋全局變量
+    # 步驟 1: 實例化機器人（同時讀取狀態快照）
     global AVE_SIGMA, AVE_ETA
-    AVE_SIGMA, AVE_ETA = auto_calculate_params(COIN_NAME, Taker_Fee_Rate)
-
-    # 步驟 2: 實例化機器人，使用計算後的參數
     bot = AvellanedaGridBot(
         API_KEY, API_SECRET, COIN_NAME,
         GRID_SPACING, INITIAL_QUANTITY, LEVERAGE,
         TAKE_PROFIT_SPACING,
-        gamma=AVE_GAMMA, eta=AVE_ETA, sigma=AVE_SIGMA, T_end=AVE_T_END
+        gamma=AVE_GAMMA, eta=AVE_ETA, sigma=AVE_SIGMA, T_end=AVE_T_END,
+        paper=PAPER_TRADING
     )
-    
+
+    # 步驟 2: 自動計算 Avellaneda 參數，並覆蓋全局變量
+    # 有可用快照時 run() 先恢復快照中的 sigma/eta，K 線計算移到後台
+    estimator = bot.snapshot.get("estimator") if bot.snapshot else None
+    if estimator:
+        AVE_SIGMA, AVE_ETA = estimator["sigma"], estimator["eta"]
+        bot.refresh_task = asyncio.create_task(bot.refresh_params(Taker_Fee_Rate))
+    else:
+        AVE_SIGMA, AVE_ETA = auto_calculate_params(COIN_NAME, Taker_Fee_Rate)
+        bot.sigma, bot.eta = AVE_SIGMA, AVE_ETA
+        logger.info(f"Avellaneda 參數: Sigma={AVE_SIGMA:.8f}, Eta={AVE_ETA:.2f}")
+
     # 步驟 3: 運行機器人
     await bot.run()
 
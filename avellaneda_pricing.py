@@ -0,0 +1,109 @@
+"""
+Avellaneda-Stoikov 報價引擎
+與價格無關的報價項按 (gamma, eta, sigma) 緩存，支持滾動有限期限（剩餘時間 T 隨週期衰減）
+以及按實時波動率切換的參數組
+"""
+import math
+import time
+
+# ==================== 配置 ====================
+VOL_HALF_LIFE = 600.0  # 實時波動率 EWMA 半衰期（秒）
+VOL_MIN_SAMPLES = 50  # 樣本數不足時不切換參數組
+
+
+class VolatilityEstimator:
+    """以 EWMA 在線估計小時波動率（對數收益率標準差），每次更新 O(1)"""
+    def __init__(self, half_life=VOL_HALF_LIFE, min_samples=VOL_MIN_SAMPLES):
+        self.tau = half_life / math.log(2)
+        self.min_samples = min_samples
+        self.var_rate = 0.0  # 每秒對數收益率方差
+        self.samples = 0
+        self.last_price = None
+        self.last_time = None
+
+    def update(self, price, now=None):
+        now = time.time() if now is None else now
+        if self.last_price and price > 0:
+            dt = now - self.last_time
+            if dt <= 0:
+                return
+            log_return = math.log(price / self.last_price)
+            alpha = 1 - math.exp(-dt / self.tau)
+            self.var_rate += alpha * (log_return * log_return / dt - self.var_rate)
+            self.samples += 1
+        self.last_price = price
+        self.last_time = now
+
+    @property
+    def ready(self):
+        return self.samples >= self.min_samples
+
+    @property
+    def sigma(self):
+        """小時波動率，與 calculate_historical_volatility 的口徑一致"""
+        return math.sqrt(self.var_rate * 3600)
+
+
+class AvellanedaPricer:
+    """一次計算雙邊報價，緩存不隨價格變化的項"""
+    def __init__(self, T_end, rolling=True, regimes=None, estimator=None):
+        self.T_end = T_end  # 週期長度（小時）
+        self.rolling = rolling
+        # 參數組按 max_sigma 升序排列: {"max_sigma": 上限, "gamma": 值或 None, "eta": 值或 None}
+        self.regimes = sorted(regimes or [], key=lambda regime: regime["max_sigma"])
+        self.estimator = estimator or VolatilityEstimator()
+        self.regime = None
+        self.T = T_end  # 最近一次報價使用的剩餘時間
+        self._key = None
+        self._gamma_sigma2 = 0.0
+        self._spread_term = None
+
+    def time_remaining(self, now=None):
+        """剩餘時間 T（小時）；滾動模式下週期按整點對齊，重啟後保持一致"""
+        if not self.rolling:
+            return self.T_end
+        now = time.time() if now is None else now
+        period = self.T_end * 3600
+        return (period - now % period) / 3600
+
+    def select_regime(self):
+        """按實時波動率選擇參數組，樣本不足或未配置時返回 None"""
+        if not self.regimes or not self.estimator.ready:
+            return None
+        sigma = self.estimator.sigma
+        return next((regime for regime in self.regimes if sigma <= regime["max_sigma"]), self.regimes[-1])
+
+    def effective_params(self, gamma, eta):
+        """按實時波動率選擇參數組，返回實際生效的 (gamma, eta)；參數組中為 None 的項沿用基準值"""
+        self.regime = self.select_regime() if self.regimes else None
+        if self.regime:
+            gamma = self.regime.get("gamma") or gamma
+            eta = self.regime.get("eta") or eta
+        return gamma, eta
+
+    def _spread_terms(self, gamma, eta, sigma):
+        key = (gamma, eta, sigma)
+        if key != self._key:
+            self._key = key
+            self._gamma_sigma2 = gamma * sigma * sigma
+            try:
+                self._spread_term = math.log(1 + gamma / eta) / gamma
+            except (ValueError, ZeroDivisionError):
+                self._spread_term = None
+        return self._gamma_sigma2, self._spread_term
+
+    def quote(self, price, inventory, gamma, eta, sigma, now=None):
+        """返回 (reserve_price, best_bid, best_ask, delta)；參數無效時 delta 為 None
+
+        gamma / eta 應為 effective_params 的結果
+        """
+        gamma_sigma2, spread_term = self._spread_terms(gamma, eta, sigma)
+        T = self.T = self.time_remaining(now)
+
+        # R = S - q * gamma * sigma^2 * T
+        reserve_price = price - inventory * gamma_sigma2 * T
+        if spread_term is None:
+            return reserve_price, None, None, None
+        # Delta = (1/2 * gamma * sigma^2 * T + 1/gamma * ln(1 + gamma / eta)) * S
+        delta = (0.5 * gamma_sigma2 * T + spread_term) * price
+        return reserve_price, max(0.0, reserve_price - delta), max(0.0, reserve_price + delta), delta
@@ -0,0 +1,232 @@
+"""
+GridTradingBot / AvellanedaGridBot 端到端吞吐量壓測
+在本地 Gate.io 模擬器上以遞增的行情速率驅動機器人，
+輸出 messages/sec、tick-to-order 延遲分位數與事件循環延遲
+
+用法: python benchmark.py --bots grid avellaneda --rates 50 200 1000 5000 --duration 10
+      python benchmark.py --pricing 200000   # 只跑 Avellaneda 報價微基準
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import tempfile
+import time
+import types
+
+import bot
+from avellaneda_pricing import AvellanedaPricer
+from gate_simulator import GateSimulator, SIM_API_KEY, SIM_API_SECRET
+from risk_engine import RiskEngine
+
+COIN_NAME = "XRP"
+MESSAGES_PER_TICK = 2  # 每個 tick 機器人收到 book_ticker 與 tickers 兩條消息
+HANDLERS = (
+    "handle_ticker_update",
+    "handle_book_ticker_update",
+    "handle_position_update",
+    "handle_order_update",
+    "handle_balance_update",
+)
+
+
+def percentile(values, pct):
+    """最近秩百分位數"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def create_bot(kind, simulator):
+    """在模擬器上創建被測機器人"""
+    # 每輪使用獨立的風控引擎，避免頻率計數串輪
+    kwargs = {"ws_url": simulator.ws_url, "rest_url": simulator.rest_url, "risk_engine": RiskEngine()}
+    if kind == "grid":
+        return bot.GridTradingBot(SIM_API_KEY, SIM_API_SECRET, COIN_NAME, bot.GRID_SPACING, bot.INITIAL_QUANTITY,
+                                  bot.LEVERAGE, bot.TAKE_PROFIT_SPACING, **kwargs)
+
+    from avellaneda_bot import AvellanedaGridBot, GRID_SPACING, TAKE_PROFIT_SPACING, INITIAL_QUANTITY, LEVERAGE
+    return AvellanedaGridBot(SIM_API_KEY, SIM_API_SECRET, COIN_NAME, GRID_SPACING, INITIAL_QUANTITY, LEVERAGE,
+                             TAKE_PROFIT_SPACING, gamma=1.0, eta=2000.0, sigma=0.005, **kwargs)
+
+
+class Probe:
+    """包裝機器人的消息處理器與下單調用，收集壓測指標"""
+    def __init__(self, target):
+        self.messages = 0
+        self.orders = 0
+        self.tick_to_order = []
+        self.loop_lag = []
+        self.current_tick_ts = None
+        for name in HANDLERS:
+            setattr(target, name, self._count(getattr(target, name), name == "handle_ticker_update"))
+        create_order = target.exchange.create_order
+
+        def timed_create_order(*args, **kwargs):
+            if self.current_tick_ts is not None:
+                self.tick_to_order.append(time.perf_counter() - self.current_tick_ts)
+            self.orders += 1
+            return create_order(*args, **kwargs)
+
+        target.exchange.create_order = timed_create_order
+
+    def _count(self, handler, is_ticker):
+        async def wrapper(message):
+            self.messages += 1
+            if not is_ticker:
+                return await handler(message)
+            # 模擬器把 sim_ts 放在消息最後一個字段，避免再做一次 JSON 解析；訂閱回執不含該字段
+            _, found, sim_ts = message.rpartition('"sim_ts": ')
+            self.current_tick_ts = float(sim_ts[:-1]) if found else None
+            try:
+                return await handler(message)
+            finally:
+                self.current_tick_ts = None
+        return wrapper
+
+    async def monitor_loop_lag(self, interval=0.01):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(loop.time() - start - interval)
+
+
+async def run_stage(kind, rate, duration, throttle):
+    """以固定消息速率運行一輪壓測"""
+    # 每輪使用獨立的快照與熱更新目錄，避免熱啟動串輪，也不影響實盤狀態；結束後刪除
+    with tempfile.TemporaryDirectory(prefix="bench_state_") as state_dir:
+        bot.SNAPSHOT_DIR = state_dir
+        bot.RUNTIME_CONFIG_FILE = os.path.join(state_dir, "runtime_config.json")
+        return await _run_stage(kind, rate, duration, throttle)
+
+
+async def _run_stage(kind, rate, duration, throttle):
+    simulator = GateSimulator(tick_rate=rate / MESSAGES_PER_TICK, seed=0)
+    simulator.start_in_thread()
+    try:
+        target = create_bot(kind, simulator)
+        target.strategy_throttle_interval = throttle
+        probe = Probe(target)
+
+        lag_task = asyncio.create_task(probe.monitor_loop_lag())
+        bot_task = asyncio.create_task(target.run())
+        sent_before = simulator.messages_sent
+        started = time.perf_counter()
+        await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - started
+        sent = simulator.messages_sent - sent_before
+
+        for task in (bot_task, lag_task):
+            task.cancel()
+        await asyncio.gather(bot_task, lag_task, return_exceptions=True)
+    finally:
+        simulator.stop_thread()
+
+    return {
+        "bot": kind,
+        "rate": rate,
+        "offered": sent / elapsed,
+        "handled": probe.messages / elapsed,
+        "orders": probe.orders,
+        "t2o": [percentile(probe.tick_to_order, p) * 1000 for p in (50, 90, 99)],
+        "lag": [percentile(probe.loop_lag, p) * 1000 for p in (50, 99)] + [max(probe.loop_lag, default=0) * 1000],
+    }
+
+
+def legacy_calculate_avellaneda_prices(self, price):
+    """改造前的 _calculate_avellaneda_prices（T 恆定、每次重算並記錄日誌），作為微基準對照"""
+    self.inventory = self.long_position - self.short_position
+    T = self.T_end
+    self.reserve_price = price - self.inventory * self.gamma * (self.sigma**2) * T
+    try:
+        delta = (0.5 * self.gamma * (self.sigma**2) * T + (1 / self.gamma) * math.log(1 + self.gamma / self.eta)) * price
+    except (ValueError, ZeroDivisionError) as e:
+        bot.logger.error(f"Delta 計算異常: {e}. 使用備用 Delta.")
+        delta = self.grid_spacing * price * 0.5
+    self.best_bid = max(0.0, self.reserve_price - delta)
+    self.best_ask = max(0.0, self.reserve_price + delta)
+    bot.logger.info(f"Avellaneda: R={self.reserve_price:.8f}, Inv={self.inventory:.2f}, Delta={delta:.8f}")
+
+
+def benchmark_pricing(iterations):
+    """Avellaneda 報價耗時: 改造前後的 _calculate_avellaneda_prices，兩者都經過同一 logger
+
+    單次報價: 一次調用；每次調價: 改造前 adjust_grid_strategy 與多空兩側共調用三次，現在只調用一次
+    """
+    from avellaneda_bot import AvellanedaGridBot
+
+    # 不連接交易所，只設置報價用到的屬性
+    target = AvellanedaGridBot.__new__(AvellanedaGridBot)
+    target.long_position, target.short_position = 3, 1
+    target.gamma, target.eta, target.sigma, target.T_end, target.grid_spacing = 1.0, 2000.0, 0.005, 1, 0.0006
+    target.pricer = AvellanedaPricer(target.T_end)
+    target.last_regime = None
+    prices = [0.5 + i * 1e-5 for i in range(1000)]
+
+    # (名稱, 計算函數, 每次調價的調用次數)
+    candidates = (
+        ("改造前", types.MethodType(legacy_calculate_avellaneda_prices, target), 3),
+        ("AvellanedaPricer", target._calculate_avellaneda_prices, 1),
+    )
+    lines = [f"{'實現':<18}{'單次報價':>12}{'每次調價':>12}  (ns, 日誌級別 {logging.getLevelName(bot.logger.level)})"]
+    for name, calculate, calls_per_requote in candidates:
+        started = time.perf_counter_ns()
+        for i in range(iterations):
+            calculate(prices[i % 1000])
+        per_quote = (time.perf_counter_ns() - started) / iterations
+        lines.append(f"{name:<18}{per_quote:>12.0f}{per_quote * calls_per_requote:>12.0f}")
+    return lines
+
+
+def format_row(result):
+    t2o = " ".join(f"{value:8.2f}" for value in result["t2o"])
+    lag = " ".join(f"{value:8.2f}" for value in result["lag"])
+    return (f"{result['bot']:<11}{result['rate']:>9.0f}{result['offered']:>10.0f}{result['handled']:>10.0f}"
+            f"{result['orders']:>8} {t2o} {lag}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="機器人端到端吞吐量壓測")
+    parser.add_argument("--bots", nargs="+", choices=("grid", "avellaneda"), default=["grid", "avellaneda"])
+    parser.add_argument("--rates", nargs="+", type=float, default=[50, 200, 1000, 5000], help="每秒推送給機器人的行情消息數")
+    parser.add_argument("--duration", type=float, default=10.0, help="每輪壓測時長（秒）")
+    parser.add_argument("--throttle", type=float, default=1.0, help="策略節流間隔（秒），覆蓋 STRATEGY_THROTTLE_INTERVAL")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default=None, help="結果另存的檔案，例如 bench_output.txt")
+    parser.add_argument("--pricing", type=int, default=0, metavar="N", help="只運行 N 次 Avellaneda 報價微基準")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+
+    if args.pricing:
+        lines = benchmark_pricing(args.pricing)
+        print("\n".join(lines), flush=True)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        return
+
+    header = (f"{'bot':<11}{'msg/s':>9}{'offered':>10}{'handled':>10}{'orders':>8} "
+              f"{'t2o p50':>8} {'t2o p90':>8} {'t2o p99':>8} {'lag p50':>8} {'lag p99':>8} {'lag max':>8}")
+    lines = [header, "(延遲單位: ms)"]
+    print("\n".join(lines), flush=True)
+    for kind in args.bots:
+        for rate in args.rates:
+            # 機器人的 print 輸出丟棄，只保留結果表
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = await run_stage(kind, rate, args.duration, args.throttle)
+            row = format_row(result)
+            lines.append(row)
+            print(row, flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
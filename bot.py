@@ -12,6 +12,9 @@ import time
 import ccxt
 import math
 import os
+from paper_trading import PaperExchange
+from profiler import default_diagnostics
+from risk_engine import RiskEngine, default_engine
 
 # ==================== 配置 ====================
 API_KEY = ""  # 替換為你的 API Key
@@ -28,6 +31,12 @@ ORDER_COOLDOWN_TIME = 60  # 鎖倉後的反向掛單冷卻時間（秒）
 SYNC_TIME = 3  # 同步時間（秒）
 ORDER_FIRST_TIME = 1  # 首單間隔時間
 STRATEGY_THROTTLE_INTERVAL = 10
+SNAPSHOT_DIR = "state"  # 狀態快照目錄
+SNAPSHOT_INTERVAL = 30  # 狀態快照間隔（秒）
+SNAPSHOT_MAX_AGE = 3600  # 快照有效期（秒），超過則冷啟動
+SNAPSHOT_VERSION = 1  # 快照格式版本
+RUNTIME_CONFIG_FILE = "runtime_config.json"  # 運行時參數檔案（熱更新）
+CONFIG_POLL_INTERVAL = 2  # 參數檔案檢查間隔（秒）
 
 # ==================== 日志配置 ====================
 script_name = os.path.splitext(os.path.basename(__file__))[0]
@@ -42,6 +51,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger()
 
+# 參數熱更新審計日誌：固定 INFO 級別，不受主日誌級別影響，也不重複寫入主日誌
+audit_logger = logging.getLogger("config_audit")
+audit_logger.setLevel(logging.INFO)
+audit_logger.propagate = False
+audit_handler = logging.FileHandler("log/config_audit.log")
+audit_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+audit_logger.addHandler(audit_handler)
+
 
 class CustomGate(ccxt.gate):
     """自定義 Gate.io 交易所類"""
@@ -55,7 +72,15 @@ class CustomGate(ccxt.gate):
 
 
 class GridTradingBot:
-    def __init__(self, api_key, api_secret, coin_name, grid_spacing, initial_quantity, leverage, take_profit_spacing=None):
+    # 可熱更新的參數: 配置名 -> (屬性名, 類型, 校驗函數)
+    RELOADABLE_PARAMS = {
+        "POSITION_THRESHOLD": ("position_threshold", int, lambda v: v > 0),
+        "ORDER_COOLDOWN_TIME": ("order_cooldown_time", float, lambda v: v >= 0),
+        "STRATEGY_THROTTLE_INTERVAL": ("strategy_throttle_interval", float, lambda v: v >= 0),
+    }
+
+    def __init__(self, api_key, api_secret, coin_name, grid_spacing, initial_quantity, leverage, take_profit_spacing=None,
+                 ws_url=WEBSOCKET_URL, rest_url=None, paper=False, risk_engine=None):
         self.api_key = api_key
         self.api_secret = api_secret
         self.coin_name = coin_name
@@ -63,10 +88,24 @@ class GridTradingBot:
         self.take_profit_spacing = take_profit_spacing or grid_spacing
         self.initial_quantity = initial_quantity
         self.leverage = leverage
-        self.exchange = self._initialize_exchange()
+        self.ws_url = ws_url
+        self.rest_url = rest_url
+        self.paper = paper
         self.ccxt_symbol = f"{coin_name}/USDT:USDT"
         self.ws_symbol = f"{coin_name}_USDT"
-        self.price_precision = self._get_price_precision()
+        self.exchange = self._initialize_exchange()
+        # 有可用快照時跳過 fetch_markets，由後台校驗；紙上交易每次從空帳戶開始，不使用快照
+        self.snapshot = None if paper else self.load_snapshot(coin_name)
+        if self.snapshot:
+            self.price_precision = self.snapshot["price_precision"]
+            self.contract_size = self.snapshot.get("contract_size", 1.0)
+        else:
+            market = self._fetch_market()
+            self.price_precision = self._get_price_precision(market)
+            self.contract_size = float(market.get("contractSize") or 1)
+        # 同一進程內的實盤機器人默認共用一個風控引擎；紙上交易使用獨立引擎，不影響實盤持倉與頻率額度
+        self.risk_engine = risk_engine or (RiskEngine() if paper else default_engine)
+        self.risk_engine.register(self.ccxt_symbol, self.contract_size, leverage)
 
         self.long_initial_quantity = initial_quantity
         self.short_initial_quantity = initial_quantity
@@ -91,6 +130,18 @@ class GridTradingBot:
         self.lower_price_short = 0
         self.upper_price_short = 0
         self.last_strategy_run_time = 0.0
+        self.last_book_ticker_id = 0
+        self.position_updates = 0  # WebSocket 持倉推送計數，用於判斷 REST 結果是否已過時
+        self.order_updates = 0  # WebSocket 掛單推送計數
+        self.balance_updates = 0  # WebSocket 餘額推送計數
+        self.paper_tasks = set()  # 紙上交易事件處理任務，持有引用避免被回收
+        self.last_snapshot_time = 0.0
+        self.reconcile_task = None
+        self.position_threshold = POSITION_THRESHOLD
+        self.order_cooldown_time = ORDER_COOLDOWN_TIME
+        self.strategy_throttle_interval = STRATEGY_THROTTLE_INTERVAL
+        self.pending_params = None
+        self.diagnostics = default_diagnostics  # 事件循環監控與診斷信號按進程共用
 
     def _initialize_exchange(self):
         """初始化交易所 API"""
@@ -99,18 +150,35 @@ class GridTradingBot:
             "secret": self.api_secret,
             "options": {"defaultType": "future"},
         })
+        if self.rest_url:
+            # 將所有 REST 端點指向指定地址（例如本地模擬器）
+            exchange.urls["api"] = self._override_urls(exchange.urls["api"], self.rest_url)
+        if self.paper:
+            # 紙上交易: 下單與查詢走本地模擬帳戶，成交事件按 WebSocket 消息格式回送
+            exchange = PaperExchange(exchange, self.ccxt_symbol, self.ws_symbol)
+            exchange.account.listener = self._on_paper_event
+            logger.info(f"紙上交易模式: {self.ccxt_symbol} 不會向交易所發送訂單")
         return exchange
 
-    def _get_price_precision(self):
+    def _override_urls(self, urls, rest_url):
+        """遞歸替換 ccxt 的 API 地址"""
+        if isinstance(urls, dict):
+            return {key: self._override_urls(value, rest_url) for key, value in urls.items()}
+        return rest_url
+
+    def _fetch_market(self, exchange=None):
+        """獲取交易對的合約資訊"""
+        markets = (exchange or self.exchange).fetch_markets()
+        return next(market for market in markets if market["symbol"] == self.ccxt_symbol)
+
+    def _get_price_precision(self, market):
         """獲取交易對的價格精度"""
-        markets = self.exchange.fetch_markets()
-        symbol_info = next(market for market in markets if market["symbol"] == self.ccxt_symbol)
-        return int(-math.log10(float(symbol_info["precision"]["price"])))
+        return int(-math.log10(float(market["precision"]["price"])))
 
-    def get_position(self):
+    def get_position(self, exchange=None):
         """獲取當前持倉"""
         params = {'settle': 'usdt', 'type': 'swap'}
-        positions = self.exchange.fetch_positions(params=params)
+        positions = (exchange or self.exchange).fetch_positions(params=params)
         long_position = 0
         short_position = 0
 
@@ -125,9 +193,25 @@ class GridTradingBot:
 
         return long_position, short_position
 
-    def check_orders_status(self):
+    def get_balance(self, exchange=None):
+        """獲取 USDT 合約帳戶餘額"""
+        balance = (exchange or self.exchange).fetch_balance({'settle': 'usdt', 'type': 'swap'})
+        return float(balance['USDT']['total'])
+
+    def _set_balance(self, balance_amount, change=0.0):
+        """更新本地 USDT 餘額並同步到風控引擎"""
+        self.balance["USDT"] = {"balance": balance_amount, "change": change}
+        self.risk_engine.update_balance(balance_amount)
+
+    def check_orders_status(self, orders=None):
         """檢查當前所有掛單的狀態"""
-        orders = self.exchange.fetch_open_orders(self.ccxt_symbol)
+        if orders is None:
+            orders = self.exchange.fetch_open_orders(self.ccxt_symbol)
+        self.risk_engine.sync_orders(self.ccxt_symbol, [
+            (str(order['id']), order.get('side'), order.get('remaining') or order.get('amount'), order.get('price'),
+             order.get('reduceOnly'))
+            for order in orders if order.get('status') == 'open' and order.get('price')
+        ])
         buy_long_orders_count = 0
         sell_long_orders_count = 0
         sell_short_orders_count = 0
@@ -150,30 +234,260 @@ class GridTradingBot:
 
         return buy_long_orders_count, sell_long_orders_count, sell_short_orders_count, buy_short_orders_count
 
-    async def run(self):
-        """啟動 WebSocket 監聽"""
-        self.long_position, self.short_position = self.get_position()
-        logger.info(f"初始化持倉: 多頭 {self.long_position} 張, 空頭 {self.short_position} 張")
+    @classmethod
+    def snapshot_path(cls, coin_name):
+        """狀態快照檔案路徑"""
+        return os.path.join(SNAPSHOT_DIR, f"{cls.__name__}_{coin_name}.json")
 
-        self.buy_long_orders, self.sell_long_orders, self.sell_short_orders, self.buy_short_orders = self.check_orders_status()
-        logger.info(f"初始化掛單: 多頭開倉={self.buy_long_orders}, 多頭止盈={self.sell_long_orders}, "
-                   f"空頭開倉={self.sell_short_orders}, 空頭止盈={self.buy_short_orders}")
+    @classmethod
+    def load_snapshot(cls, coin_name):
+        """讀取狀態快照，不存在、損壞或過期時返回 None"""
+        path = cls.snapshot_path(coin_name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取快照失敗，改為冷啟動: {e}")
+            return None
+
+        age = time.time() - state.get("saved_at", 0)
+        if state.get("version") != SNAPSHOT_VERSION or age > SNAPSHOT_MAX_AGE:
+            logger.info(f"快照版本不符或已過期 ({age:.0f} 秒)，改為冷啟動")
+            return None
+        return state
+
+    def snapshot_state(self):
+        """生成狀態快照"""
+        return {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": time.time(),
+            "symbol": self.ccxt_symbol,
+            "price_precision": self.price_precision,
+            "contract_size": self.contract_size,
+            "positions": {"long": self.long_position, "short": self.short_position},
+            "orders": {
+                "buy_long": self.buy_long_orders,
+                "sell_long": self.sell_long_orders,
+                "sell_short": self.sell_short_orders,
+                "buy_short": self.buy_short_orders,
+            },
+            "latest_price": self.latest_price,
+            "balance": self.balance,
+        }
 
+    def restore_snapshot(self, state):
+        """從快照恢復狀態"""
+        self.long_position = state["positions"]["long"]
+        self.short_position = state["positions"]["short"]
+        orders = state["orders"]
+        self.buy_long_orders = orders["buy_long"]
+        self.sell_long_orders = orders["sell_long"]
+        self.sell_short_orders = orders["sell_short"]
+        self.buy_short_orders = orders["buy_short"]
+        self.latest_price = state.get("latest_price", 0)
+        self.balance = state.get("balance", {})
+        self._sync_risk_position()
+        if "USDT" in self.balance:
+            self._set_balance(self.balance["USDT"]["balance"], self.balance["USDT"]["change"])
+        # 視快照為最新同步結果，避免首個 tick 阻塞在 REST 同步上
+        self.last_position_update_time = self.last_orders_update_time = time.time()
+
+    def save_snapshot(self):
+        """原子寫入狀態快照"""
+        if self.paper:
+            return
+        path = self.snapshot_path(self.coin_name)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot_state(), f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+            self.last_snapshot_time = time.time()
+        except OSError as e:
+            logger.error(f"寫入快照失敗: {e}")
+
+    async def snapshot_loop(self):
+        """定期保存狀態快照"""
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            self.save_snapshot()
+
+    async def reconcile_with_exchange(self):
+        """後台以 REST 校驗快照恢復的狀態"""
+        loop = asyncio.get_running_loop()
+        position_updates, order_updates = self.position_updates, self.order_updates
+        balance_updates = self.balance_updates
+        # ccxt 同步客戶端不是線程安全的，後台線程使用獨立客戶端，不與事件循環線程共用 self.exchange
+        exchange = self._initialize_exchange()
+        try:
+            market = await loop.run_in_executor(None, self._fetch_market, exchange)
+            balance = await loop.run_in_executor(None, self.get_balance, exchange)
+            positions = await loop.run_in_executor(None, self.get_position, exchange)
+            open_orders = await loop.run_in_executor(None, exchange.fetch_open_orders, self.ccxt_symbol)
+        except Exception as e:
+            logger.error(f"快照校驗失敗: {e}")
+            return
+        # 解析與風控同步放在事件循環線程內
+        price_precision = self._get_price_precision(market)
+        if price_precision != self.price_precision:
+            logger.warning(f"價格精度與快照不符: 快照 {self.price_precision}, 交易所 {price_precision}")
+        self.price_precision = price_precision
+        self.contract_size = float(market.get("contractSize") or 1)
+        self.risk_engine.register(self.ccxt_symbol, self.contract_size, self.leverage)
+
+        if self.balance_updates == balance_updates:
+            self._set_balance(balance)
+
+        snapshot_positions = (self.snapshot["positions"]["long"], self.snapshot["positions"]["short"])
+        if positions != snapshot_positions:
+            logger.warning(f"持倉與快照不符: 快照 {snapshot_positions}, 交易所 {positions}")
+        # REST 往返期間收到的 WebSocket 推送比 REST 結果新，不再覆蓋
+        if self.position_updates != position_updates:
+            logger.info(f"校驗期間已收到持倉推送，保留當前持倉 {(self.long_position, self.short_position)}")
+        else:
+            self.long_position, self.short_position = positions
+            self._sync_risk_position()
+            self.last_position_update_time = time.time()
+
+        if self.order_updates != order_updates:
+            logger.info("校驗期間已收到掛單推送，掛單留待下次定期同步")
+        else:
+            snapshot_orders = self.snapshot["orders"]
+            snapshot_orders = (snapshot_orders["buy_long"], snapshot_orders["sell_long"],
+                               snapshot_orders["sell_short"], snapshot_orders["buy_short"])
+            orders = self.check_orders_status(open_orders)
+            if orders != snapshot_orders:
+                logger.warning(f"掛單與快照不符，以交易所為準: 快照 {snapshot_orders}, 交易所 {orders}")
+            self.buy_long_orders, self.sell_long_orders, self.sell_short_orders, self.buy_short_orders = orders
+            self.last_orders_update_time = time.time()
+        logger.info("快照校驗完成")
+
+    def validate_params(self, config):
+        """校驗運行時參數，任一項不合法則整體拒絕"""
+        if not isinstance(config, dict):
+            raise ValueError("參數檔案必須是 JSON 物件")
+
+        # 頂層參數對所有實例生效，以幣種為鍵的區塊只對該幣種生效
+        raw = {k: v for k, v in config.items() if not isinstance(v, dict)}
+        section = config.get(self.coin_name)
+        if isinstance(section, dict):
+            raw.update(section)
+
+        params = {}
+        for name, value in raw.items():
+            if name not in self.RELOADABLE_PARAMS:
+                logger.warning(f"忽略不支持熱更新的參數: {name}")
+                continue
+            _, cast, check = self.RELOADABLE_PARAMS[name]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"{name} 必須是數值: {value!r}")
+            if not math.isfinite(value):
+                raise ValueError(f"{name} 必須是有限數值: {value!r}")
+            if cast is int and value != int(value):
+                raise ValueError(f"{name} 必須是整數: {value!r}")
+            value = cast(value)
+            if not check(value):
+                raise ValueError(f"{name} 超出允許範圍: {value!r}")
+            params[name] = value
+        return params
+
+    def load_runtime_config(self):
+        """讀取並校驗參數檔案，待下一個策略週期前生效"""
+        try:
+            with open(RUNTIME_CONFIG_FILE, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            params = self.validate_params(config)
+        except (OSError, ValueError, TypeError, OverflowError) as e:
+            logger.error(f"參數熱更新被拒絕: {e}")
+            audit_logger.info(json.dumps({"symbol": self.ccxt_symbol, "status": "rejected", "reason": str(e)}, ensure_ascii=False))
+            return
+        self.pending_params = params
+
+    def apply_pending_params(self):
+        """在策略週期之間原子地套用待生效參數"""
+        if not self.pending_params:
+            return
+        params, self.pending_params = self.pending_params, None
+
+        changes = {}
+        for name, value in params.items():
+            attr = self.RELOADABLE_PARAMS[name][0]
+            old = getattr(self, attr)
+            if old != value:
+                changes[name] = {"old": old, "new": value}
+                setattr(self, attr, value)
+
+        if changes:
+            logger.info(f"參數已熱更新: {changes}")
+            audit_logger.info(json.dumps({"symbol": self.ccxt_symbol, "status": "applied", "changes": changes}, ensure_ascii=False))
+
+    async def config_watch_loop(self):
+        """監視參數檔案，變更時重新載入"""
+        last_mtime = None
         while True:
             try:
-                await self.connect_websocket()
-            except Exception as e:
-                logger.error(f"WebSocket 連接失敗: {e}")
-                await asyncio.sleep(5)
+                mtime = os.stat(RUNTIME_CONFIG_FILE).st_mtime
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != last_mtime:
+                last_mtime = mtime
+                try:
+                    self.load_runtime_config()
+                except Exception as e:
+                    # 任何意外錯誤都不能讓監視任務退出，否則之後的修改永遠不會生效
+                    logger.error(f"參數檔案處理異常: {e}")
+            await asyncio.sleep(CONFIG_POLL_INTERVAL)
+
+    async def run(self):
+        """啟動 WebSocket 監聽"""
+        if self.snapshot:
+            self.restore_snapshot(self.snapshot)
+            logger.info(f"從快照恢復持倉: 多頭 {self.long_position} 張, 空頭 {self.short_position} 張，後台校驗中")
+            self.reconcile_task = asyncio.create_task(self.reconcile_with_exchange())
+        else:
+            self.long_position, self.short_position = self.get_position()
+            self._sync_risk_position()
+            logger.info(f"初始化持倉: 多頭 {self.long_position} 張, 空頭 {self.short_position} 張")
+            self._set_balance(self.get_balance())
+            logger.info(f"初始化餘額: {self.balance['USDT']['balance']} USDT")
+
+            self.buy_long_orders, self.sell_long_orders, self.sell_short_orders, self.buy_short_orders = self.check_orders_status()
+            logger.info(f"初始化掛單: 多頭開倉={self.buy_long_orders}, 多頭止盈={self.sell_long_orders}, "
+                       f"空頭開倉={self.sell_short_orders}, 空頭止盈={self.buy_short_orders}")
+
+        snapshot_task = asyncio.create_task(self.snapshot_loop())
+        config_task = asyncio.create_task(self.config_watch_loop())
+        self.diagnostics.acquire()
+        try:
+            while True:
+                try:
+                    await self.connect_websocket()
+                except Exception as e:
+                    logger.error(f"WebSocket 連接失敗: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            snapshot_task.cancel()
+            config_task.cancel()
+            self.diagnostics.release()
+            self.save_snapshot()
 
     async def connect_websocket(self):
         """連接 WebSocket 並訂閱數據"""
-        async with websockets.connect(WEBSOCKET_URL) as websocket:
+        async with websockets.connect(self.ws_url) as websocket:
+            # book_ticker 序號只在同一連接內有意義，重連或切換端點後重新計數
+            self.last_book_ticker_id = 0
             await self.subscribe_ticker(websocket)
-            await self.subscribe_positions(websocket)
-            await self.subscribe_orders(websocket)
+            if self.paper:
+                await self.subscribe_trades(websocket)
+            else:
+                await self.subscribe_positions(websocket)
+                await self.subscribe_orders(websocket)
             await self.subscribe_book_ticker(websocket)
-            await self.subscribe_balances(websocket)
+            if not self.paper:
+                await self.subscribe_balances(websocket)
 
             while True:
                 try:
@@ -191,6 +505,8 @@ class GridTradingBot:
                         await self.handle_book_ticker_update(message)
                     elif channel == "futures.balances":
                         await self.handle_balance_update(message)
+                    elif channel == "futures.trades":
+                        await self.handle_trades_update(message)
                 except Exception as e:
                     logger.error(f"WebSocket 消息處理失敗: {e}")
                     break
@@ -241,6 +557,20 @@ class GridTradingBot:
         }
         await websocket.send(json.dumps(payload))
 
+    async def subscribe_trades(self, websocket):
+        """訂閱成交（紙上交易撮合用）"""
+        current_time = int(time.time())
+        message = f"channel=futures.trades&event=subscribe&time={current_time}"
+        sign = self._generate_sign(message)
+        payload = {
+            "time": current_time,
+            "channel": "futures.trades",
+            "event": "subscribe",
+            "payload": [self.ws_symbol],
+            "auth": {"method": "api_key", "KEY": self.api_key, "SIGN": sign},
+        }
+        await websocket.send(json.dumps(payload))
+
     async def subscribe_orders(self, websocket):
         """訂閱掛單"""
         current_time = int(time.time())
@@ -278,7 +608,11 @@ class GridTradingBot:
                 currency = balance.get("currency", "UNKNOWN")
                 balance_amount = float(balance.get("balance", 0))
                 change = float(balance.get("change", 0))
-                self.balance[currency] = {"balance": balance_amount, "change": change}
+                if currency == "USDT":
+                    self.balance_updates += 1
+                    self._set_balance(balance_amount, change)
+                else:
+                    self.balance[currency] = {"balance": balance_amount, "change": change}
                 print(f"餘額更新: 幣種={currency}, 餘額={balance_amount}, 變化={change}")
 
     async def handle_ticker_update(self, message):
@@ -286,12 +620,14 @@ class GridTradingBot:
         data = json.loads(message)
         if data.get("event") == "update":
             self.latest_price = float(data["result"][0]["last"])
+            self.risk_engine.update_price(self.ccxt_symbol, self.latest_price)
+            self.apply_pending_params()
             # print(f"最新價格: {self.latest_price:.8f}") # 可以註釋掉這行以減少終端輸出
 
             # --- 頻率控制：策略節流 (Throttling) 邏輯 START ---
             current_time = time.time()
             # 檢查是否已超過最小間隔
-            if current_time - self.last_strategy_run_time < STRATEGY_THROTTLE_INTERVAL:
+            if current_time - self.last_strategy_run_time < self.strategy_throttle_interval:
                 return  # 間隔未到，跳過本次策略調整
 
             # 更新上次執行時間
@@ -301,6 +637,7 @@ class GridTradingBot:
             # ... (以下為原本的同步邏輯) ...
             if time.time() - self.last_position_update_time > SYNC_TIME:
                 self.long_position, self.short_position = self.get_position()
+                self._sync_risk_position()
                 self.last_position_update_time = time.time()
                 print(f"同步 position: 多頭 {self.long_position}, 空頭 {self.short_position}")
 
@@ -317,8 +654,40 @@ class GridTradingBot:
         if data.get("event") == "update":
             ticker = data["result"]
             if ticker:
+                # 丟棄同一連接內序號落後的舊行情
+                update_id = ticker.get("u", 0)
+                if update_id and update_id < self.last_book_ticker_id:
+                    return
+                self.last_book_ticker_id = update_id or self.last_book_ticker_id
                 self.best_bid_price = float(ticker.get("b", 0))
                 self.best_ask_price = float(ticker.get("a", 0))
+                if self.paper:
+                    self.exchange.account.on_book_ticker(self.best_bid_price, self.best_ask_price)
+
+    async def handle_trades_update(self, message):
+        """處理成交更新（紙上交易撮合）"""
+        data = json.loads(message)
+        if data.get("event") == "update" and self.paper:
+            for trade in data.get("result", []):
+                self.exchange.account.on_trade(float(trade["price"]), trade["size"])
+
+    def _on_paper_event(self, channel, result):
+        """模擬帳戶事件轉為私有頻道消息，交給原有處理器"""
+        message = json.dumps({"time": int(time.time()), "channel": channel, "event": "update", "result": result})
+        handler = {
+            "futures.orders": self.handle_order_update,
+            "futures.positions": self.handle_position_update,
+            "futures.balances": self.handle_balance_update,
+        }[channel]
+        task = asyncio.get_running_loop().create_task(handler(message))
+        self.paper_tasks.add(task)
+        task.add_done_callback(self._on_paper_task_done)
+
+    def _on_paper_task_done(self, task):
+        """釋放已完成的紙上交易事件任務，並記錄處理器異常"""
+        self.paper_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"紙上交易事件處理失敗: {task.exception()}")
 
     async def handle_position_update(self, message):
         """處理持倉更新"""
@@ -333,6 +702,8 @@ class GridTradingBot:
                 else:
                     self.short_position = abs(float(position.get("size", 0)))
                     logger.info(f"更新空頭持倉: {self.short_position}")
+                self.position_updates += 1
+                self._sync_risk_position()
 
     async def handle_order_update(self, message):
         """處理掛單更新"""
@@ -340,12 +711,18 @@ class GridTradingBot:
         if data.get("event") == "update":
             order_data = data["result"]
             if isinstance(order_data, list) and len(order_data) > 0:
+                self.order_updates += 1
                 for order in order_data:
                     if 'is_reduce_only' not in order or 'size' not in order:
                         continue
 
                     size = order.get('size', 0)
                     is_reduce_only = order.get('is_reduce_only', False)
+                    if 'id' in order:
+                        self.risk_engine.update_order(
+                            self.ccxt_symbol, str(order['id']), 'buy' if size > 0 else 'sell', order.get('left', 0),
+                            order.get('price', 0), is_reduce_only, order.get('status') == 'open',
+                        )
 
                     if size > 0:
                         if is_reduce_only:
@@ -373,6 +750,8 @@ class GridTradingBot:
         current_time = time.time()
         if current_time - self.last_long_order_time < ORDER_FIRST_TIME:
             return
+        if not self.best_bid_price or not self.best_ask_price:
+            return  # 尚未收到盤口數據
 
         self.cancel_orders_for_side('long')
         mid_price = (self.best_bid_price + self.best_ask_price) / 2
@@ -385,6 +764,8 @@ class GridTradingBot:
         current_time = time.time()
         if current_time - self.last_short_order_time < ORDER_FIRST_TIME:
             return
+        if not self.best_bid_price or not self.best_ask_price:
+            return  # 尚未收到盤口數據
 
         self.cancel_orders_for_side('short')
         mid_price = (self.best_bid_price + self.best_ask_price) / 2
@@ -407,8 +788,30 @@ class GridTradingBot:
                 elif order['reduceOnly'] and order['side'] == 'buy' and order['status'] == 'open':
                     self.cancel_order(order['id'])
 
+    def _sync_risk_position(self):
+        """把當前持倉同步到風控引擎"""
+        self.risk_engine.update_position(self.ccxt_symbol, self.long_position, self.short_position)
+
+    def _check_risk(self, side, price, quantity, is_reduce_only):
+        """下單前風控審核，拒絕時記錄原因"""
+        reason = self.risk_engine.check_order(self.ccxt_symbol, side, quantity, price, is_reduce_only,
+                                              self.position_threshold)
+        if reason:
+            logger.warning(f"風控拒單: {side} {quantity} @ {price}: {reason}")
+            return False
+        return True
+
+    def _track_order(self, order):
+        """下單成功後立即登記掛單，不必等 WebSocket 推送"""
+        if order and order.get('id') and order.get('price'):
+            self.risk_engine.update_order(
+                self.ccxt_symbol, str(order['id']), order.get('side'), order.get('remaining') or order.get('amount'),
+                order['price'], order.get('reduceOnly'), order.get('status', 'open') == 'open',
+            )
+
     def cancel_order(self, order_id):
         """撤單"""
+        self.risk_engine.record_cancel()
         try:
             self.exchange.cancel_order(order_id, self.ccxt_symbol)
         except ccxt.BaseError as e:
@@ -416,20 +819,24 @@ class GridTradingBot:
 
     def place_order(self, side, price, quantity, is_reduce_only=False, position_side=None):
         """掛單"""
+        if not self._check_risk(side, price, quantity, is_reduce_only):
+            return
         try:
             params = {'reduce_only': is_reduce_only}
-            self.exchange.create_order(self.ccxt_symbol, 'limit', side, quantity, price, params)
+            self._track_order(self.exchange.create_order(self.ccxt_symbol, 'limit', side, quantity, price, params))
         except ccxt.BaseError as e:
             logger.error(f"下單報錯: {e}")
 
     def place_take_profit_order(self, ccxt_symbol, side, price, quantity):
         """掛止盈單"""
+        order_side = {'long': 'sell', 'short': 'buy'}.get(side)
+        if order_side is None or not self._check_risk(order_side, price, quantity, True):
+            return
         try:
+            self._track_order(self.exchange.create_order(ccxt_symbol, 'limit', order_side, quantity, price, {'reduce_only': True}))
             if side == 'long':
-                self.exchange.create_order(ccxt_symbol, 'limit', 'sell', quantity, price, {'reduce_only': True})
                 logger.info(f"成功掛 long 止盈單: 賣出 {quantity} @ {price}")
-            elif side == 'short':
-                self.exchange.create_order(ccxt_symbol, 'limit', 'buy', quantity, price, {'reduce_only': True})
+            else:
                 logger.info(f"成功掛 short 止盈單: 買入 {quantity} @ {price}")
         except ccxt.BaseError as e:
             logger.error(f"掛止盈單失敗: {e}")
@@ -439,8 +846,8 @@ class GridTradingBot:
         try:
             self.get_take_profit_quantity(self.long_position, 'long')
             if self.long_position > 0:
-                if self.long_position > POSITION_THRESHOLD:
-                    print(f"持倉{self.long_position}超過閾值 {POSITION_THRESHOLD}，long裝死")
+                if self.long_position > self.position_threshold:
+                    print(f"持倉{self.long_position}超過閾值 {self.position_threshold}，long裝死")
                     if self.sell_long_orders <= 0:
                         r = float((int(self.long_position / max(self.short_position, 1)) / 100) + 1)
                         self.place_take_profit_order(self.ccxt_symbol, 'long', self.latest_price * r, self.long_initial_quantity)
@@ -458,8 +865,8 @@ class GridTradingBot:
         try:
             self.get_take_profit_quantity(self.short_position, 'short')
             if self.short_position > 0:
-                if self.short_position > POSITION_THRESHOLD:
-                    print(f"持倉{self.short_position}超過閾值 {POSITION_THRESHOLD}，short裝死")
+                if self.short_position > self.position_threshold:
+                    print(f"持倉{self.short_position}超過閾值 {self.position_threshold}，short裝死")
                     if self.buy_short_orders <= 0:
                         r = float((int(self.short_position / max(self.long_position, 1)) / 100) + 1)
                         self.place_take_profit_order(self.ccxt_symbol, 'short', self.latest_price / r, self.short_initial_quantity)
@@ -474,8 +881,8 @@ class GridTradingBot:
 
     def check_and_reduce_positions(self):
         """檢查並減倉"""
-        local_threshold = int(POSITION_THRESHOLD * 0.8)
-        reduce_qty = int(POSITION_THRESHOLD * 0.1)
+        local_threshold = int(self.position_threshold * 0.8)
+        reduce_qty = int(self.position_threshold * 0.1)
 
         if self.long_position >= local_threshold and self.short_position >= local_threshold:
             logger.info(f"雙向持倉超過閾值，開始減倉")
@@ -504,7 +911,7 @@ class GridTradingBot:
             await self.initialize_long_orders()
         else:
             if not (0 < self.buy_long_orders <= self.long_initial_quantity) or not (0 < self.sell_long_orders <= self.long_initial_quantity):
-                if self.long_position > POSITION_THRESHOLD and current_time - self.last_long_order_time < ORDER_COOLDOWN_TIME:
+                if self.long_position > self.position_threshold and current_time - self.last_long_order_time < self.order_cooldown_time:
                     pass
                 else:
                     await self.place_long_orders(self.latest_price)
@@ -513,7 +920,7 @@ class GridTradingBot:
             await self.initialize_short_orders()
         else:
             if not (0 < self.sell_short_orders <= self.short_initial_quantity) or not (0 < self.buy_short_orders <= self.short_initial_quantity):
-                if self.short_position > POSITION_THRESHOLD and current_time - self.last_short_order_time < ORDER_COOLDOWN_TIME:
+                if self.short_position > self.position_threshold and current_time - self.last_short_order_time < self.order_cooldown_time:
                     pass
                 else:
                     await self.place_short_orders(self.latest_price)
@@ -0,0 +1,407 @@
+"""
+Gate.io 合約交易所本地模擬器
+提供 futures WebSocket 協議（tickers / book_ticker / trades / orders / positions / balances）
+與 CustomGate 使用的 REST 端點，內含撮合引擎，用於離線測試與壓測
+
+用法: python gate_simulator.py --tick-rate 20 --ws-port 8765 --rest-port 8080
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import math
+import random
+import threading
+import time
+from urllib.parse import parse_qs, unquote_plus, urlsplit
+
+import websockets
+
+from matching_engine import MAKER_FEE_RATE, TAKER_FEE_RATE, SimulatedAccount, SimulatorError
+
+# ==================== 配置 ====================
+SIM_CONTRACT = "XRP_USDT"  # 模擬合約
+SIM_API_KEY = "sim_key"  # 模擬器 API Key
+SIM_API_SECRET = "sim_secret"  # 模擬器 API Secret
+SIM_START_PRICE = 0.5  # 初始價格
+SIM_PRICE_ROUND = "0.0001"  # 價格最小變動單位
+SIM_QUANTO_MULTIPLIER = "10"  # 每張合約對應幣數
+SIM_VOLATILITY = 0.0005  # 每個 tick 的對數價格波動
+SIM_BALANCE = 10000.0  # 初始 USDT 餘額
+MAX_TICKS_PER_WAKE = 100  # 落後時每次喚醒最多補發的 tick 數，保證事件循環能處理連接與 REST
+PRIVATE_CHANNELS = {"futures.orders", "futures.positions", "futures.balances"}
+
+logger = logging.getLogger("gate_simulator")
+
+
+class GateSimulator:
+    """本地 Gate.io 合約交易所: WebSocket + REST + 隨機遊走行情"""
+    def __init__(self, contract=SIM_CONTRACT, api_key=SIM_API_KEY, api_secret=SIM_API_SECRET, tick_rate=10.0,
+                 start_price=SIM_START_PRICE, volatility=SIM_VOLATILITY, host="127.0.0.1", ws_port=0, rest_port=0,
+                 seed=None):
+        self.contract = contract
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.tick_rate = tick_rate
+        self.mid = start_price
+        self.volatility = volatility
+        self.host = host
+        self.ws_port = ws_port
+        self.rest_port = rest_port
+        self.price_decimals = len(SIM_PRICE_ROUND.split(".")[1])
+        self.tick_size = float(SIM_PRICE_ROUND)
+        self.account = SimulatedAccount(contract, SIM_BALANCE, float(SIM_QUANTO_MULTIPLIER))
+        self.account.listener = self._on_account_event
+        self.messages_sent = 0
+        self.ticks = 0
+        self._rng = random.Random(seed)
+        self._clients = {}  # websocket -> 已訂閱頻道
+        self._ws_server = None
+        self._rest_server = None
+        self._tick_task = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def ws_url(self):
+        return f"ws://{self.host}:{self.ws_port}/v4/ws/usdt"
+
+    @property
+    def rest_url(self):
+        return f"http://{self.host}:{self.rest_port}/api/v4"
+
+    # ---------- 生命週期 ----------
+    async def start(self):
+        """啟動 WebSocket、REST 服務與行情推送"""
+        self._ws_server = await websockets.serve(self._ws_handler, self.host, self.ws_port)
+        self.ws_port = self._ws_server.sockets[0].getsockname()[1]
+        self._rest_server = await asyncio.start_server(self._rest_handler, self.host, self.rest_port)
+        self.rest_port = self._rest_server.sockets[0].getsockname()[1]
+        self._tick_task = asyncio.create_task(self._tick_loop())
+        logger.info(f"模擬器已啟動: WS {self.ws_url}, REST {self.rest_url}, {self.tick_rate} ticks/s")
+
+    async def stop(self):
+        if self._tick_task:
+            self._tick_task.cancel()
+        if self._ws_server:
+            self._ws_server.close()
+            await self._ws_server.wait_closed()
+        if self._rest_server:
+            self._rest_server.close()
+            await self._rest_server.wait_closed()
+
+    def start_in_thread(self):
+        """在獨立線程的事件循環中運行，避免與被測機器人的同步 REST 調用互相阻塞"""
+        ready = threading.Event()
+
+        def runner():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=runner, name="gate-simulator", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop_thread(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    # ---------- 行情 ----------
+    async def _tick_loop(self):
+        """按 tick_rate 推送行情，落後時分批補發"""
+        start = time.perf_counter()
+        while True:
+            due = int((time.perf_counter() - start) * self.tick_rate)
+            for _ in range(min(due - self.ticks, MAX_TICKS_PER_WAKE)):
+                await self._tick()
+            await asyncio.sleep(max(0.0, start + (self.ticks + 1) / self.tick_rate - time.perf_counter()))
+
+    async def _tick(self):
+        self.ticks += 1
+        self.mid *= math.exp(self.volatility * self._rng.gauss(0, 1))
+        bid = round(math.floor(self.mid / self.tick_size) * self.tick_size, self.price_decimals)
+        ask = round(bid + self.tick_size, self.price_decimals)
+        trade_price = ask if self._rng.random() < 0.5 else bid
+        trade_size = self._rng.randint(1, 20) * (1 if trade_price == ask else -1)
+        now = time.time()
+
+        self.account.on_book_ticker(bid, ask)
+        self.account.on_trade(trade_price, trade_size)
+
+        await self._broadcast("futures.book_ticker", {
+            "t": int(now * 1000), "u": self.ticks, "s": self.contract,
+            "b": str(bid), "B": self._rng.randint(1, 5000), "a": str(ask), "A": self._rng.randint(1, 5000),
+        })
+        await self._broadcast("futures.trades", [{
+            "id": self.ticks, "contract": self.contract, "size": trade_size, "price": str(trade_price),
+            "create_time": int(now), "create_time_ms": int(now * 1000),
+        }])
+        await self._broadcast("futures.tickers", [self._ticker(trade_price)])
+
+    def _ticker(self, last):
+        mark_price = str(round(self.mid, self.price_decimals + 2))
+        return {
+            "contract": self.contract,
+            "last": str(last),
+            "mark_price": mark_price,
+            "index_price": mark_price,
+            "change_percentage": "0",
+            "funding_rate": "0.0001",
+            "funding_rate_indicative": "0.0001",
+            "total_size": str(self.account.long["size"] + self.account.short["size"]),
+            "volume_24h": "0",
+            "volume_24h_base": "0",
+            "volume_24h_quote": "0",
+            "volume_24h_settle": "0",
+            "high_24h": mark_price,
+            "low_24h": mark_price,
+            "lowest_ask": str(self.account.ask),
+            "highest_bid": str(self.account.bid),
+        }
+
+    # ---------- WebSocket ----------
+    def _envelope(self, channel, event, result):
+        now = time.time()
+        # sim_ts 為模擬器擴展字段（perf_counter 發送時間），固定放在最後，供壓測計算延遲
+        return json.dumps({"time": int(now), "time_ms": int(now * 1000), "channel": channel, "event": event,
+                           "result": result, "sim_ts": time.perf_counter()})
+
+    async def _broadcast(self, channel, result):
+        message = None
+        for websocket, subscriptions in list(self._clients.items()):
+            if channel not in subscriptions:
+                continue
+            message = message or self._envelope(channel, "update", result)
+            try:
+                await websocket.send(message)
+                self.messages_sent += 1
+            except websockets.ConnectionClosed:
+                self._clients.pop(websocket, None)
+
+    def _on_account_event(self, channel, result):
+        asyncio.ensure_future(self._broadcast(channel, result))
+
+    def _check_ws_auth(self, request):
+        auth = request.get("auth") or {}
+        message = f"channel={request.get('channel')}&event={request.get('event')}&time={request.get('time')}"
+        sign = hmac.new(self.api_secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha512).hexdigest()
+        return auth.get("KEY") == self.api_key and hmac.compare_digest(str(auth.get("SIGN", "")), sign)
+
+    def _check_rest_auth(self, method, url, headers, body):
+        """按 Gate APIv4 規則校驗 REST 簽名: 方法、路徑、查詢串、請求體 SHA512 與時間戳以換行連接後做 HMAC-SHA512"""
+        body_hash = hashlib.sha512(body).hexdigest()
+        message = "\n".join((method, url.path, unquote_plus(url.query), body_hash, headers.get("timestamp", "")))
+        sign = hmac.new(self.api_secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha512).hexdigest()
+        return hmac.compare_digest(headers.get("sign", ""), sign)
+
+    def _handle_ws_request(self, request, subscriptions):
+        channel = request.get("channel")
+        event = request.get("event")
+        response = {"time": int(time.time()), "time_ms": int(time.time() * 1000), "channel": channel, "event": event}
+        if channel == "futures.ping":
+            response["channel"] = "futures.pong"
+            response["result"] = None
+        elif event not in ("subscribe", "unsubscribe"):
+            response["error"] = {"code": 1, "message": f"unknown event {event}"}
+            response["result"] = {"status": "failed"}
+        elif channel in PRIVATE_CHANNELS and not self._check_ws_auth(request):
+            response["error"] = {"code": 2, "message": "invalid key or signature"}
+            response["result"] = {"status": "failed"}
+        else:
+            if event == "subscribe":
+                subscriptions.add(channel)
+            else:
+                subscriptions.discard(channel)
+            response["result"] = {"status": "success"}
+        return response
+
+    async def _ws_handler(self, websocket, path=None):
+        subscriptions = set()
+        self._clients[websocket] = subscriptions
+        try:
+            async for raw in websocket:
+                try:
+                    request = json.loads(raw)
+                except ValueError:
+                    continue
+                await websocket.send(json.dumps(self._handle_ws_request(request, subscriptions)))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._clients.pop(websocket, None)
+
+    # ---------- REST ----------
+    async def _rest_handler(self, reader, writer):
+        """極簡 HTTP/1.1 服務（支持 keep-alive）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode("latin-1").split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = self._route(method.upper(), target, headers, body)
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            # 模擬器關閉時取消的連接直接結束
+            pass
+        finally:
+            writer.close()
+
+    def _route(self, method, target, headers, body):
+        url = urlsplit(target)
+        path = url.path.split("/api/v4", 1)[-1].rstrip("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        prefix = "/futures/usdt"
+        private = path.startswith(prefix) and not path.startswith(f"{prefix}/contracts") and not path.startswith(f"{prefix}/tickers")
+        if private and headers.get("key") != self.api_key:
+            return 401, {"label": "INVALID_KEY", "message": "Invalid key provided"}
+        if private and not self._check_rest_auth(method, url, headers, body):
+            return 401, {"label": "INVALID_SIGNATURE", "message": "Signature mismatch"}
+
+        try:
+            if method == "GET" and path == f"{prefix}/contracts":
+                return 200, [self._contract()]
+            if method == "GET" and path == f"{prefix}/contracts/{self.contract}":
+                return 200, self._contract()
+            if method == "GET" and path == f"{prefix}/tickers":
+                return 200, [self._ticker(self.account.mid_price() or self.mid)]
+            if method == "GET" and path == f"{prefix}/positions":
+                return 200, self.account.positions()
+            if method == "GET" and path == f"{prefix}/accounts":
+                return 200, self._futures_account()
+            if method == "GET" and path == f"{prefix}/orders":
+                if query.get("status", "open") != "open":
+                    return 200, []
+                return 200, [self._rest_order(order) for order in self.account.open_orders()]
+            if method == "POST" and path == f"{prefix}/orders":
+                request = json.loads(body or b"{}")
+                if request.get("contract", self.contract) != self.contract:
+                    raise SimulatorError("CONTRACT_NOT_FOUND", f"unknown contract {request.get('contract')}")
+                order = self.account.create_order(
+                    float(request.get("size", 0)), request.get("price", 0),
+                    bool(request.get("reduce_only", False)), request.get("tif", "gtc"), request.get("text", "api"),
+                )
+                return 201, self._rest_order(order)
+            if method == "DELETE" and path.startswith(f"{prefix}/orders/"):
+                return 200, self._rest_order(self.account.cancel_order(path.rsplit("/", 1)[1]))
+            if method == "GET":
+                # 現貨、交割、期權等其他市場列表一律返回空
+                return 200, []
+        except SimulatorError as e:
+            return 400, {"label": e.label, "message": e.message}
+        except (ValueError, TypeError) as e:
+            return 400, {"label": "INVALID_PARAM_VALUE", "message": str(e)}
+        return 404, {"label": "NOT_FOUND", "message": f"{method} {path}"}
+
+    def _rest_order(self, order):
+        """REST 返回的價格字段為字符串"""
+        order = dict(order)
+        order["price"] = str(order["price"])
+        order["fill_price"] = str(order["fill_price"])
+        return order
+
+    def _futures_account(self):
+        return {
+            "currency": "USDT",
+            "total": str(self.account.balance),
+            "available": str(self.account.balance),
+            "unrealised_pnl": "0",
+            "position_margin": "0",
+            "order_margin": "0",
+            "point": "0",
+            "in_dual_mode": True,
+        }
+
+    def _contract(self):
+        mark_price = str(round(self.mid, self.price_decimals + 2))
+        return {
+            "name": self.contract,
+            "type": "direct",
+            "quanto_multiplier": SIM_QUANTO_MULTIPLIER,
+            "leverage_min": "1",
+            "leverage_max": "100",
+            "maintenance_rate": "0.005",
+            "mark_type": "index",
+            "mark_price": mark_price,
+            "index_price": mark_price,
+            "last_price": mark_price,
+            "maker_fee_rate": str(MAKER_FEE_RATE),
+            "taker_fee_rate": str(TAKER_FEE_RATE),
+            "order_price_round": SIM_PRICE_ROUND,
+            "mark_price_round": SIM_PRICE_ROUND,
+            "funding_rate": "0.0001",
+            "funding_interval": 28800,
+            "funding_next_apply": int(time.time()) + 28800,
+            "risk_limit_base": "1000000",
+            "risk_limit_step": "1000000",
+            "risk_limit_max": "8000000",
+            "order_size_min": 1,
+            "order_size_max": 1000000,
+            "order_price_deviate": "0.5",
+            "ref_discount_rate": "0",
+            "ref_rebate_rate": "0",
+            "orderbook_id": self.ticks,
+            "trade_id": self.ticks,
+            "trade_size": 0,
+            "position_size": 0,
+            "config_change_time": 0,
+            "in_delisting": False,
+            "orders_limit": 100,
+            "enable_bonus": False,
+            "enable_credit": True,
+            "create_time": 0,
+        }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Gate.io 合約交易所本地模擬器")
+    parser.add_argument("--contract", default=SIM_CONTRACT)
+    parser.add_argument("--tick-rate", type=float, default=10.0, help="每秒行情 tick 數")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ws-port", type=int, default=8765)
+    parser.add_argument("--rest-port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    simulator = GateSimulator(args.contract, tick_rate=args.tick_rate, host=args.host,
+                              ws_port=args.ws_port, rest_port=args.rest_port, seed=args.seed)
+    await simulator.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,217 @@
+"""
+撮合引擎: 單合約、雙向持倉模式的模擬帳戶
+本地模擬器 (gate_simulator.py) 與紙上交易 (paper_trading.py) 共用，訂單與持倉均為 Gate 格式
+"""
+import itertools
+import time
+
+# ==================== 配置 ====================
+DEFAULT_BALANCE = 10000.0  # 初始 USDT 餘額
+MAKER_FEE_RATE = 0.0002
+TAKER_FEE_RATE = 0.0005
+
+
+class SimulatorError(Exception):
+    """模擬交易所業務錯誤，對應 Gate 的 label/message 錯誤格式"""
+    def __init__(self, label, message):
+        super().__init__(f"{label}: {message}")
+        self.label = label
+        self.message = message
+
+
+class SimulatedAccount:
+    """模擬帳戶與撮合引擎（單合約、雙向持倉模式）"""
+    def __init__(self, contract, balance=DEFAULT_BALANCE, quanto_multiplier=1.0,
+                 maker_fee_rate=MAKER_FEE_RATE, taker_fee_rate=TAKER_FEE_RATE):
+        self.contract = contract
+        self.balance = balance
+        self.quanto_multiplier = quanto_multiplier
+        self.maker_fee_rate = maker_fee_rate
+        self.taker_fee_rate = taker_fee_rate
+        self.orders = {}  # 掛單中的訂單: id -> Gate 格式訂單
+        self.long = {"size": 0, "entry_price": 0.0, "realised_pnl": 0.0}
+        self.short = {"size": 0, "entry_price": 0.0, "realised_pnl": 0.0}
+        self.bid = None
+        self.ask = None
+        self.listener = None  # 事件回調: listener(channel, result)
+        self._order_ids = itertools.count(int(time.time() * 1000))
+
+    def _emit(self, channel, result):
+        if self.listener:
+            self.listener(channel, result)
+
+    def _side_of(self, order):
+        """訂單作用的持倉方向與是否為平倉"""
+        is_buy = order["size"] > 0
+        if order["is_reduce_only"]:
+            return (self.short, False) if is_buy else (self.long, False)
+        return (self.long, True) if is_buy else (self.short, True)
+
+    def create_order(self, size, price, reduce_only=False, tif="gtc", text="api"):
+        """下限價單，可成交部分立即以對手價成交"""
+        size = int(size)
+        price = float(price)
+        if size == 0:
+            raise SimulatorError("INVALID_PARAM_VALUE", "size must not be zero")
+        if price <= 0:
+            raise SimulatorError("INVALID_PARAM_VALUE", "price must be positive")
+        if reduce_only:
+            position = self.short if size > 0 else self.long
+            if position["size"] < abs(size):
+                raise SimulatorError("REDUCE_ONLY_FAIL", "reduce-only order would increase position")
+
+        now = time.time()
+        order = {
+            "id": next(self._order_ids),
+            "contract": self.contract,
+            "size": size,
+            "left": size,
+            "price": price,
+            "fill_price": 0.0,
+            "status": "open",
+            "finish_as": "",
+            "is_reduce_only": reduce_only,
+            "is_close": False,
+            "tif": tif,
+            "text": text,
+            "iceberg": 0,
+            "create_time": now,
+            "create_time_ms": int(now * 1000),
+            "finish_time": 0,
+            "finish_time_ms": 0,
+        }
+        self.orders[order["id"]] = order
+        self._emit("futures.orders", [dict(order)])
+
+        if size > 0 and self.ask is not None and price >= self.ask:
+            self._fill(order, abs(size), self.ask, self.taker_fee_rate)
+        elif size < 0 and self.bid is not None and price <= self.bid:
+            self._fill(order, abs(size), self.bid, self.taker_fee_rate)
+        if order["status"] == "open" and tif == "ioc":
+            self._finish(order, "cancelled")
+        return dict(order)
+
+    def cancel_order(self, order_id):
+        """撤單"""
+        order = self.orders.get(int(order_id))
+        if order is None:
+            raise SimulatorError("ORDER_NOT_FOUND", f"order {order_id} not found")
+        self._finish(order, "cancelled")
+        return dict(order)
+
+    def open_orders(self):
+        return [dict(order) for order in self.orders.values()]
+
+    def positions(self):
+        """Gate 格式的雙向持倉"""
+        now = time.time()
+        mark_price = self.mid_price()
+        result = []
+        for mode, position, sign in (("dual_long", self.long, 1), ("dual_short", self.short, -1)):
+            entry_price = position["entry_price"]
+            unrealised = sign * (mark_price - entry_price) * position["size"] * self.quanto_multiplier if mark_price else 0.0
+            result.append({
+                "contract": self.contract,
+                "size": sign * position["size"],
+                "mode": mode,
+                "leverage": "0",
+                "cross_leverage_limit": "20",
+                "risk_limit": "1000000",
+                "leverage_max": "100",
+                "maintenance_rate": "0.005",
+                "value": str(position["size"] * self.quanto_multiplier * (mark_price or 0.0)),
+                "margin": "0",
+                "entry_price": str(entry_price),
+                "liq_price": "0",
+                "mark_price": str(mark_price or 0.0),
+                "unrealised_pnl": str(unrealised),
+                "realised_pnl": str(position["realised_pnl"]),
+                "history_pnl": str(position["realised_pnl"]),
+                "last_close_pnl": "0",
+                "adl_ranking": 5,
+                "pending_orders": len(self.orders),
+                "update_time": int(now),
+                "time": int(now),
+                "time_ms": int(now * 1000),
+            })
+        return result
+
+    def mid_price(self):
+        if self.bid is None or self.ask is None:
+            return None
+        return (self.bid + self.ask) / 2
+
+    def on_book_ticker(self, bid, ask):
+        """盤口變動時撮合被穿越的掛單（以掛單價成交）"""
+        self.bid = bid
+        self.ask = ask
+        for order in list(self.orders.values()):
+            if order["size"] > 0 and order["price"] >= ask:
+                self._fill(order, abs(order["left"]), order["price"], self.maker_fee_rate)
+            elif order["size"] < 0 and order["price"] <= bid:
+                self._fill(order, abs(order["left"]), order["price"], self.maker_fee_rate)
+
+    def on_trade(self, price, size):
+        """市場成交打到掛單價位時按成交量撮合"""
+        remaining = abs(size)
+        for order in list(self.orders.values()):
+            if remaining <= 0:
+                break
+            if (order["size"] > 0 and price <= order["price"]) or (order["size"] < 0 and price >= order["price"]):
+                qty = min(abs(order["left"]), remaining)
+                self._fill(order, qty, order["price"], self.maker_fee_rate)
+                remaining -= qty
+
+    def _fill(self, order, qty, price, fee_rate):
+        position, is_open = self._side_of(order)
+        if not is_open:
+            qty = min(qty, position["size"])
+        if qty <= 0:
+            self._finish(order, "cancelled")
+            return
+
+        pnl = 0.0
+        if is_open:
+            total = position["size"] + qty
+            position["entry_price"] = (position["entry_price"] * position["size"] + price * qty) / total
+            position["size"] = total
+        else:
+            sign = 1 if position is self.long else -1
+            pnl = sign * (price - position["entry_price"]) * qty * self.quanto_multiplier
+            position["size"] -= qty
+            position["realised_pnl"] += pnl
+            if position["size"] == 0:
+                position["entry_price"] = 0.0
+
+        fee = price * qty * self.quanto_multiplier * fee_rate
+        self.balance += pnl - fee
+
+        direction = 1 if order["size"] > 0 else -1
+        filled = abs(order["size"]) - abs(order["left"])
+        order["fill_price"] = (order["fill_price"] * filled + price * qty) / (filled + qty)
+        order["left"] = direction * (abs(order["left"]) - qty)
+        if order["left"] == 0:
+            self._finish(order, "filled")
+        else:
+            self._emit("futures.orders", [dict(order)])
+
+        self._emit("futures.positions", [p for p in self.positions() if p["mode"] == ("dual_long" if position is self.long else "dual_short")])
+        now = time.time()
+        self._emit("futures.balances", [{
+            "balance": self.balance,
+            "change": pnl - fee,
+            "currency": "USDT",
+            "text": f"{self.contract}:{order['id']}",
+            "type": "pnl" if pnl else "fee",
+            "time": int(now),
+            "time_ms": int(now * 1000),
+        }])
+
+    def _finish(self, order, finish_as):
+        now = time.time()
+        order["status"] = "finished"
+        order["finish_as"] = finish_as
+        order["finish_time"] = int(now)
+        order["finish_time_ms"] = int(now * 1000)
+        self.orders.pop(order["id"], None)
+        self._emit("futures.orders", [dict(order)])
@@ -0,0 +1,81 @@
+"""
+紙上交易：行情與合約元數據走真實交易所，下單、撤單與持倉/掛單查詢走本地模擬帳戶
+"""
+import ccxt
+
+from matching_engine import SimulatedAccount, SimulatorError
+
+
+class PaperExchange:
+    """ccxt 兼容的紙上交易所，只實現機器人用到的接口"""
+    def __init__(self, exchange, symbol, contract):
+        self.exchange = exchange  # 真實交易所，僅用於公共數據
+        self.symbol = symbol
+        self.account = SimulatedAccount(contract)
+
+    def fetch_markets(self, params=None):
+        """合約元數據取自真實交易所，並同步合約乘數到模擬帳戶"""
+        markets = self.exchange.fetch_markets()
+        for market in markets:
+            if market["symbol"] == self.symbol and market.get("contractSize"):
+                self.account.quanto_multiplier = float(market["contractSize"])
+        return markets
+
+    def fetch_positions(self, symbols=None, params=None):
+        return [self._parse_position(position) for position in self.account.positions()]
+
+    def fetch_balance(self, params=None):
+        balance = self.account.balance
+        return {"USDT": {"free": balance, "used": 0.0, "total": balance}}
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        return [self._parse_order(order) for order in self.account.open_orders()]
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        params = params or {}
+        size = amount if side == 'buy' else -amount
+        reduce_only = bool(params.get('reduce_only', params.get('reduceOnly', False)))
+        try:
+            order = self.account.create_order(size, price, reduce_only)
+        except SimulatorError as e:
+            raise ccxt.InvalidOrder(f"paper {e}")
+        return self._parse_order(order)
+
+    def cancel_order(self, id, symbol=None, params=None):
+        try:
+            order = self.account.cancel_order(id)
+        except SimulatorError as e:
+            raise ccxt.OrderNotFound(f"paper {e}")
+        return self._parse_order(order)
+
+    def _parse_order(self, order):
+        """Gate 格式訂單轉為 ccxt 統一結構"""
+        size = order["size"]
+        left = order["left"]
+        if order["status"] == "open":
+            status = "open"
+        else:
+            status = "closed" if order["finish_as"] == "filled" else "canceled"
+        return {
+            "id": str(order["id"]),
+            "symbol": self.symbol,
+            "type": "limit",
+            "side": "buy" if size > 0 else "sell",
+            "price": order["price"],
+            "amount": abs(size),
+            "filled": abs(size) - abs(left),
+            "remaining": abs(left),
+            "status": status,
+            "reduceOnly": order["is_reduce_only"],
+            "info": order,
+        }
+
+    def _parse_position(self, position):
+        """Gate 格式持倉轉為 ccxt 統一結構"""
+        return {
+            "symbol": self.symbol,
+            "contracts": abs(position["size"]),
+            "side": "long" if position["mode"] == "dual_long" else "short",
+            "entryPrice": float(position["entry_price"]),
+            "info": position,
+        }
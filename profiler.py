@@ -0,0 +1,243 @@
+"""
+運行時性能診斷: 採樣分析器與事件循環延遲監控
+"""
+import asyncio
+import collections
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+import time
+
+# ==================== 配置 ====================
+PROFILE_INTERVAL = 0.005  # 採樣間隔（秒）
+LOOP_LAG_INTERVAL = 0.1  # 事件循環心跳間隔（秒）
+SLOW_CALLBACK_THRESHOLD = 0.1  # 超過此延遲（秒）視為阻塞並記錄元兇
+LOOP_LAG_HISTORY = 3000  # 保留的延遲樣本數
+SLOW_EVENT_HISTORY = 200  # 保留的阻塞事件數
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger()
+
+
+def _frame_label(frame, current_line=False):
+    """函數標籤；採樣時用函數首行以便同一函數的樣本合併"""
+    code = frame.f_code
+    line = frame.f_lineno if current_line else code.co_firstlineno
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{line})"
+
+
+def _stack(frame):
+    """調用棧，由外到內"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _is_project_frame(frame):
+    filename = os.path.abspath(frame.f_code.co_filename)
+    return filename.startswith(PROJECT_DIR) and "site-packages" not in filename and filename != os.path.abspath(__file__)
+
+
+class SamplingProfiler:
+    """定時採樣指定線程的調用棧，輸出 flamegraph.pl / speedscope 兼容的 folded 格式"""
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.started_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.samples.clear()
+        self.started_at = time.time()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[";".join(_frame_label(f) for f in _stack(frame))] += 1
+
+    def dump(self, path):
+        """寫出 folded 格式: 每行 "外層;...;內層 採樣數" """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return sum(self.samples.values())
+
+
+class LoopMonitor:
+    """事件循環延遲監控
+
+    協程心跳記錄每次喚醒的延遲；看門狗線程在心跳逾時時抓取事件循環線程的調用棧，
+    據此判斷阻塞來自哪個處理器、REST 調用或日誌輸出。
+    """
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold=SLOW_CALLBACK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = collections.deque(maxlen=LOOP_LAG_HISTORY)
+        self.max_lag = 0.0
+        self.slow_events = collections.deque(maxlen=SLOW_EVENT_HISTORY)
+        self.culprits = {}  # 元兇 -> [次數, 總阻塞秒數, 最長阻塞秒數]
+        self._deadline = None
+        self._blocked_stack = None
+        self._loop_thread_id = None
+        self._stop_event = threading.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop_event.clear()
+        watchdog = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                self._blocked_stack = None
+                start = loop.time()
+                self._deadline = time.perf_counter() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, loop.time() - start - self.interval)
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if lag >= self.threshold:
+                    self._record_slow(lag, self._blocked_stack)
+        finally:
+            self._stop_event.set()
+
+    def _watchdog(self):
+        while not self._stop_event.wait(self.threshold / 2):
+            deadline = self._deadline
+            if deadline is None or self._blocked_stack is not None:
+                continue
+            if time.perf_counter() - deadline >= self.threshold / 2:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._blocked_stack = _stack(frame)
+
+    def _record_slow(self, lag, stack):
+        culprit = self.describe(stack) if stack else "未知（阻塞在採樣前已結束）"
+        self.slow_events.append({"time": time.time(), "lag": lag, "culprit": culprit})
+        stats = self.culprits.setdefault(culprit, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += lag
+        stats[2] = max(stats[2], lag)
+        logger.warning(f"事件循環阻塞 {lag * 1000:.0f} ms: {culprit}")
+
+    @staticmethod
+    def describe(stack):
+        """把調用棧歸類為 處理器 > 項目內最深函數 [REST 調用/日誌輸出]"""
+        project_frames = [frame for frame in stack if _is_project_frame(frame)]
+        handler = next((frame.f_code.co_name for frame in project_frames if frame.f_code.co_name.startswith("handle_")), None)
+        innermost = _frame_label(project_frames[-1] if project_frames else stack[-1], current_line=True)
+
+        modules = [frame.f_globals.get("__name__", "") for frame in stack]
+        if any(name == "ccxt" or name.startswith("ccxt.") for name in modules):
+            category = "REST 調用"
+        elif any(name == "logging" or name.startswith("logging.") for name in modules):
+            category = "日誌輸出"
+        else:
+            category = "處理器"
+        return " > ".join(part for part in (handler, innermost) if part) + f" [{category}]"
+
+    def percentile(self, pct):
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+    def report(self):
+        """延遲統計與按總阻塞時間排序的元兇列表"""
+        lines = [
+            f"事件循環延遲: p50={self.percentile(50) * 1000:.1f} ms, p99={self.percentile(99) * 1000:.1f} ms, "
+            f"max={self.max_lag * 1000:.1f} ms, 阻塞事件 {sum(stats[0] for stats in self.culprits.values())} 次"
+        ]
+        for culprit, (count, total, longest) in sorted(self.culprits.items(), key=lambda item: item[1][1], reverse=True):
+            lines.append(f"  {total * 1000:8.0f} ms 總計 | {count:5d} 次 | 最長 {longest * 1000:6.0f} ms | {culprit}")
+        return "\n".join(lines)
+
+
+class Diagnostics:
+    """進程級診斷: 同一進程內的所有機器人共用一個事件循環監控、採樣分析器與診斷信號
+
+    每個機器人在 run() 中 acquire()、退出時 release()；第一個使用者啟動監控並註冊信號，
+    最後一個使用者退出時才停止監控並移除信號。
+    """
+    def __init__(self):
+        self.loop_monitor = LoopMonitor()
+        self.profiler = None
+        self.users = 0
+        self._monitor_task = None
+        self._signals = []
+
+    def acquire(self):
+        self.users += 1
+        if self.users == 1:
+            self._monitor_task = asyncio.get_running_loop().create_task(self.loop_monitor.run())
+            self._signals = self._install_signal_handlers()
+
+    def release(self):
+        self.users -= 1
+        if self.users > 0:
+            return
+        self._monitor_task.cancel()
+        loop = asyncio.get_running_loop()
+        for sig in self._signals:
+            loop.remove_signal_handler(sig)
+        self._signals = []
+        if self.profiler:
+            self.profiler.stop()
+            self.profiler = None
+
+    def toggle_profiler(self):
+        """啟動或停止採樣分析，停止時輸出 folded 格式檔案（可用 flamegraph.pl / speedscope 查看）"""
+        if self.profiler and self.profiler.running:
+            self.profiler.stop()
+            path = os.path.join("log", f"profile_{time.strftime('%Y%m%d_%H%M%S')}.folded")
+            samples = self.profiler.dump(path)
+            logger.info(f"採樣分析已停止: {samples} 個樣本寫入 {path}")
+            self.profiler = None
+        else:
+            self.profiler = SamplingProfiler(threading.get_ident())
+            self.profiler.start()
+            logger.info("採樣分析已啟動，再次發送 SIGUSR1 停止並輸出結果")
+
+    def log_loop_report(self):
+        """輸出事件循環延遲與阻塞元兇報告"""
+        logger.info(self.loop_monitor.report())
+
+    def _install_signal_handlers(self):
+        """SIGUSR1 切換採樣分析，SIGUSR2 輸出阻塞報告（僅 Unix 主線程）"""
+        if not hasattr(signal, "SIGUSR1"):
+            return []
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.toggle_profiler)
+            loop.add_signal_handler(signal.SIGUSR2, self.log_loop_report)
+        except (NotImplementedError, RuntimeError, ValueError) as e:
+            logger.warning(f"無法註冊診斷信號: {e}")
+            return []
+        return [signal.SIGUSR1, signal.SIGUSR2]
+
+
+# 進程內共用的診斷實例
+default_diagnostics = Diagnostics()
@@ -0,0 +1,187 @@
+"""
+交易前風控引擎
+所有訂單在發往交易所前經此審核。敞口、掛單名義價值、保證金佔用與每分鐘下單/撤單次數
+都隨事件以 O(1) 增量維護，同一進程內所有交易對共用一個引擎。
+"""
+import collections
+import time
+
+# ==================== 配置 ====================
+MAX_NET_EXPOSURE = 5000.0  # 淨敞口上限（USDT 名義價值，含掛單最壞情況）
+MAX_GROSS_EXPOSURE = 20000.0  # 總敞口上限（多空持倉 + 開倉掛單，USDT）
+MAX_MARGIN_USAGE = 0.8  # 保證金佔用上限（佔 USDT 餘額比例）
+MAX_ORDERS_PER_MINUTE = 120  # 每分鐘下單次數上限
+MAX_CANCELS_PER_MINUTE = 300  # 每分鐘撤單次數上限，超過後暫停開倉（撤單與平倉單從不因此攔截）
+RATE_WINDOW = 60  # 頻率統計窗口（秒）
+
+
+class _SymbolState:
+    """單個交易對的風控狀態，以及它對全局匯總的當前貢獻"""
+    __slots__ = ("contract_size", "leverage", "price", "long", "short", "orders",
+                 "open_buy", "open_sell", "net", "gross", "margin")
+
+    def __init__(self, contract_size, leverage):
+        self.contract_size = contract_size
+        self.leverage = leverage
+        self.price = 0.0
+        self.long = 0.0
+        self.short = 0.0
+        self.orders = {}  # 開倉掛單: id -> (方向 1/-1, 剩餘張數, 價格)
+        self.open_buy = 0.0  # 開倉買單名義價值
+        self.open_sell = 0.0  # 開倉賣單名義價值
+        self.net = 0.0
+        self.gross = 0.0
+        self.margin = 0.0
+
+
+class RiskEngine:
+    """交易前風控: check_order 返回拒絕原因，通過時返回 None；撤單只計數不攔截"""
+    def __init__(self, max_net_exposure=MAX_NET_EXPOSURE, max_gross_exposure=MAX_GROSS_EXPOSURE,
+                 max_margin_usage=MAX_MARGIN_USAGE, max_orders_per_minute=MAX_ORDERS_PER_MINUTE,
+                 max_cancels_per_minute=MAX_CANCELS_PER_MINUTE):
+        self.max_net_exposure = max_net_exposure
+        self.max_gross_exposure = max_gross_exposure
+        self.max_margin_usage = max_margin_usage
+        self.max_orders_per_minute = max_orders_per_minute
+        self.max_cancels_per_minute = max_cancels_per_minute
+        self.symbols = {}
+        self.balance = None  # USDT 餘額，未知時拒絕開倉單
+        # 全局匯總，隨事件增量更新
+        self.net_exposure = 0.0
+        self.gross_exposure = 0.0
+        self.open_buy_notional = 0.0
+        self.open_sell_notional = 0.0
+        self.margin_used = 0.0
+        self.order_times = collections.deque()
+        self.cancel_times = collections.deque()
+
+    def register(self, symbol, contract_size=1.0, leverage=1):
+        """登記交易對；重複登記只更新合約乘數與槓桿"""
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = _SymbolState(contract_size, leverage)
+        else:
+            state.contract_size = contract_size
+            state.leverage = leverage
+            self._refresh(state)
+        return state
+
+    # ---------- 事件 ----------
+    def update_price(self, symbol, price):
+        state = self.symbols[symbol]
+        state.price = price
+        self._refresh(state)
+
+    def update_position(self, symbol, long_position, short_position):
+        state = self.symbols[symbol]
+        state.long = float(long_position)
+        state.short = float(short_position)
+        self._refresh(state)
+
+    def update_balance(self, balance):
+        self.balance = float(balance)
+
+    def update_order(self, symbol, order_id, side, left, price, reduce_only=False, is_open=True):
+        """登記、更新或移除一張掛單；平倉單不增加敞口，不計入"""
+        state = self.symbols[symbol]
+        old = state.orders.pop(order_id, None)
+        if old:
+            self._add_open_order(state, *old, sign=-1)
+        if is_open and not reduce_only and left:
+            order = (1 if side == 'buy' else -1, abs(float(left)), float(price))
+            state.orders[order_id] = order
+            self._add_open_order(state, *order, sign=1)
+        self._refresh(state)
+
+    def sync_orders(self, symbol, orders):
+        """以 REST 同步結果重建該交易對的掛單，orders 為 (id, side, left, price, reduce_only)"""
+        state = self.symbols[symbol]
+        state.orders.clear()
+        self.open_buy_notional -= state.open_buy
+        self.open_sell_notional -= state.open_sell
+        state.open_buy = state.open_sell = 0.0
+        for order_id, side, left, price, reduce_only in orders:
+            if not reduce_only and left:
+                order = (1 if side == 'buy' else -1, abs(float(left)), float(price))
+                state.orders[order_id] = order
+                self._add_open_order(state, *order, sign=1)
+        self._refresh(state)
+
+    def _add_open_order(self, state, direction, left, price, sign):
+        notional = sign * left * price * state.contract_size
+        if direction > 0:
+            state.open_buy += notional
+            self.open_buy_notional += notional
+        else:
+            state.open_sell += notional
+            self.open_sell_notional += notional
+
+    def _refresh(self, state):
+        """以新舊差值更新全局匯總，O(1)"""
+        position_notional = state.price * state.contract_size
+        net = (state.long - state.short) * position_notional
+        gross = (state.long + state.short) * position_notional
+        margin = (gross + state.open_buy + state.open_sell) / max(state.leverage, 1)
+
+        self.net_exposure += net - state.net
+        self.gross_exposure += gross - state.gross
+        self.margin_used += margin - state.margin
+        state.net, state.gross, state.margin = net, gross, margin
+
+    # ---------- 審核 ----------
+    def _prune(self, times, now):
+        while times and now - times[0] > RATE_WINDOW:
+            times.popleft()
+
+    def check_order(self, symbol, side, quantity, price, reduce_only=False, position_limit=None):
+        """審核一張新訂單，通過時計入下單頻率
+
+        敞口已超限時，仍放行使淨敞口下降的訂單，以便雙向持倉模式下再平衡；
+        平倉單只受下單頻率限制，撤單預算用盡時仍可減倉
+        """
+        now = time.monotonic()
+        self._prune(self.order_times, now)
+        if len(self.order_times) >= self.max_orders_per_minute:
+            return f"下單頻率超限: {len(self.order_times)}/{self.max_orders_per_minute} 每分鐘"
+
+        if not reduce_only:
+            # 撤單預算用盡時舊單撤不乾淨，暫停開倉，避免新單疊在舊單上
+            self._prune(self.cancel_times, now)
+            if len(self.cancel_times) >= self.max_cancels_per_minute:
+                return f"撤單頻率超限: {len(self.cancel_times)}/{self.max_cancels_per_minute} 每分鐘，暫停開倉"
+            if self.balance is None:
+                return "USDT 餘額未知，暫停開倉"
+            if self.balance <= 0:
+                return f"USDT 餘額 {self.balance:.2f} 不足，暫停開倉"
+            state = self.symbols[symbol]
+            notional = quantity * price * state.contract_size
+            if position_limit is not None:
+                held = state.long if side == 'buy' else state.short
+                if held + quantity > position_limit:
+                    return f"{symbol} {'多' if side == 'buy' else '空'}頭持倉 {held} + {quantity} 超過上限 {position_limit}"
+            if side == 'buy':
+                worst_net = self.net_exposure + self.open_buy_notional + notional
+            else:
+                worst_net = self.net_exposure - self.open_sell_notional - notional
+            reduces_net = abs(worst_net) < abs(self.net_exposure)
+            if abs(worst_net) > self.max_net_exposure and not reduces_net:
+                return f"淨敞口 {worst_net:.2f} 超過上限 {self.max_net_exposure}"
+            gross = self.gross_exposure + self.open_buy_notional + self.open_sell_notional + notional
+            if gross > self.max_gross_exposure and not reduces_net:
+                return f"總敞口 {gross:.2f} 超過上限 {self.max_gross_exposure}"
+            margin = self.margin_used + notional / max(state.leverage, 1)
+            if margin > self.balance * self.max_margin_usage:
+                return f"保證金佔用 {margin:.2f} 超過餘額 {self.balance:.2f} 的 {self.max_margin_usage:.0%}"
+
+        self.order_times.append(now)
+        return None
+
+    def record_cancel(self):
+        """記錄一次撤單。撤單只會降低風險，從不攔截；頻率超限時由 check_order 暫停開倉"""
+        now = time.monotonic()
+        self._prune(self.cancel_times, now)
+        self.cancel_times.append(now)
+
+
+# 進程內共用的默認引擎
+default_engine = RiskEngine()